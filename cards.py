@@ -0,0 +1,219 @@
+import bisect
+import datetime
+import threading
+import uuid
+import weakref
+
+import numpy as np
+import pandas as pd
+
+YELLOW_EXPIRE_DAYS = 30
+YELLOW_WARNING_DAYS = 7  # Warn when yellow cards have less than 7 days left
+RED_WEIGHT = 3  # A red counts as this many yellows in the slacker score
+
+SUMMARY_COLUMNS = [
+    "username", "total_yellows", "total_reds", "slacker_score",
+    "yellow_active", "red_active", "penalties", "yellows_expiring",
+]
+LEADERBOARD_COLUMNS = ["username", "yellows", "reds", "slacker_score"]
+
+_buckets_lock = threading.Lock()
+# id(tickets frame) -> daily prefix sums built from it. One entry per live frame, so every
+# household's cached tickets keep their own; an entry is dropped when its frame is freed
+_buckets = {}
+
+
+def days_until_expiry(tickets, today=None):
+    """Days until each active yellow in `tickets` expires, as an Int64 column; <NA> for every other card"""
+    today = pd.Timestamp(today or datetime.date.today()).normalize()
+    expires = tickets["date_received"].dt.normalize() + pd.Timedelta(days=YELLOW_EXPIRE_DAYS)
+    days_left = (expires - today).dt.days.astype("Int64")
+    return days_left.where((tickets["card_type"] == "Yellow") & (tickets["status"] == "active"))
+
+def expire_and_convert(tickets, today=None):
+    """Expire yellows older than YELLOW_EXPIRE_DAYS, then turn every 3 active yellows a user holds into a red.
+    Returns the new table, whether anything changed and the receiver of each new red"""
+    changed = False
+    df = tickets.copy()
+    today = pd.Timestamp(today or datetime.date.today()).normalize()
+    df["date_received"] = df["date_received"].dt.normalize()
+
+    # Expire old yellows
+    mask_yellow_active = (df["card_type"] == "Yellow") & (df["status"] == "active")
+    expire_mask = mask_yellow_active & (df["date_received"] < (today - pd.Timedelta(days=YELLOW_EXPIRE_DAYS)))
+    if expire_mask.any():
+        df.loc[expire_mask, "status"] = "expired"
+        changed = True
+
+    # Convert groups of 3 active yellows into reds, oldest yellows first
+    active_yellows = df[(df["card_type"] == "Yellow") & (df["status"] == "active")].sort_values("date_received", kind="stable")
+    by_receiver = active_yellows.groupby("receiver", sort=False)
+    batches = by_receiver["id"].transform("size") // 3
+    to_convert = by_receiver.cumcount() < batches * 3
+    receivers = []
+    if to_convert.any():
+        df.loc[active_yellows.index[to_convert.to_numpy()], "status"] = "converted"
+
+        # One red per batch, receivers in table order, each batch stacked on top like a fresh card
+        batch_counts = (by_receiver.size() // 3).to_dict()
+        receivers = [user for user in df["receiver"].unique() for _ in range(batch_counts.get(user, 0))]
+        new_reds = pd.DataFrame({
+            "id": [str(uuid.uuid4()) for _ in receivers],
+            "receiver": receivers,
+            "card_type": "Red",
+            "date_received": today,
+            "submitted_by": "system",
+            "status": "active",
+            "note": "Auto-converted from 3 yellows",
+        })
+        df = pd.concat([new_reds.iloc[::-1], df], ignore_index=True)
+        changed = True
+    return df, changed, receivers
+
+# Materialized counters
+#
+# Per-user totals and active counts kept as plain dicts so a card event can be
+# applied as a delta instead of regrouping the whole history. Each user also
+# keeps the sorted received dates of their active yellows, which is enough for
+# the next expiry and the expiring-soon count.
+
+COUNTER_FIELDS = ["total_yellows", "total_reds", "yellow_active", "red_active"]
+
+def _empty_counter():
+    return {**dict.fromkeys(COUNTER_FIELDS, 0), "yellow_dates": []}
+
+def apply_card_delta(counters, card, sign):
+    """Add (sign=1) or remove (sign=-1) one card's contribution to `counters` in place"""
+    c = counters.setdefault(card["receiver"], _empty_counter())
+    yellow = card["card_type"] == "Yellow"
+    red = card["card_type"] == "Red"
+    active = card["status"] == "active"
+    c["total_yellows"] += sign * yellow
+    c["total_reds"] += sign * red
+    c["yellow_active"] += sign * (yellow and active)
+    c["red_active"] += sign * (red and active)
+    date = pd.Timestamp(card["date_received"])
+    if yellow and active and not pd.isna(date):
+        date = date.normalize()
+        if sign > 0:
+            bisect.insort(c["yellow_dates"], date)
+        else:
+            del c["yellow_dates"][bisect.bisect_left(c["yellow_dates"], date)]
+
+def build_card_counters(tickets):
+    """Per-user counters for `tickets`, computed from scratch"""
+    is_yellow = tickets["card_type"] == "Yellow"
+    is_red = tickets["card_type"] == "Red"
+    is_active = tickets["status"] == "active"
+    flags = pd.DataFrame({
+        "receiver": tickets["receiver"],
+        "total_yellows": is_yellow,
+        "total_reds": is_red,
+        "yellow_active": is_yellow & is_active,
+        "red_active": is_red & is_active,
+    })
+    counters = {user: {**row, "yellow_dates": []} for user, row in flags.groupby("receiver", observed=True).sum().astype(int).to_dict("index").items()}
+    dates = tickets.loc[is_yellow & is_active, "date_received"].dropna().dt.normalize()
+    for user, user_dates in dates.groupby(tickets["receiver"], observed=True):
+        counters[user]["yellow_dates"] = sorted(user_dates)
+    return counters
+
+def same_counters(a, b):
+    """Whether two sets of counters agree, ignoring users left with no cards"""
+    def nonzero(counters):
+        return {user: c for user, c in counters.items() if any(c[f] for f in COUNTER_FIELDS)}
+    return nonzero(a) == nonzero(b)
+
+def counters_summary(counters, usernames, today=None):
+    """Per-user totals, active counts, slacker score and expiring-soon count (SUMMARY_COLUMNS), plus each
+    user's next yellow expiry, read from `counters`"""
+    today = pd.Timestamp(today or datetime.date.today()).normalize()
+    expire = pd.Timedelta(days=YELLOW_EXPIRE_DAYS)
+    # Yellows with 1..YELLOW_WARNING_DAYS days left were received in this window
+    first, last = today - expire + pd.Timedelta(days=1), today - expire + pd.Timedelta(days=YELLOW_WARNING_DAYS)
+    rows = []
+    for user in usernames:
+        c = counters.get(user) or _empty_counter()
+        dates = c["yellow_dates"]
+        rows.append({
+            "username": user,
+            **{f: c[f] for f in COUNTER_FIELDS},
+            "yellows_expiring": bisect.bisect_right(dates, last) - bisect.bisect_left(dates, first),
+            "next_expiry": dates[0] + expire if dates else pd.NaT,
+        })
+    summary = pd.DataFrame(rows, columns=["username", *COUNTER_FIELDS, "yellows_expiring", "next_expiry"])
+    summary["slacker_score"] = summary["total_yellows"] + summary["total_reds"] * RED_WEIGHT
+    summary["penalties"] = summary["red_active"]
+    return summary[SUMMARY_COLUMNS + ["next_expiry"]]
+
+# Windowed leaderboards
+#
+# Cards are bucketed per user and per day received, and each user's buckets are
+# turned into running totals, so the yellows and reds in any date window are
+# one subtraction per user however long the history is.
+
+def daily_card_buckets(tickets):
+    """Per-user running yellow/red counts by day received, from the first day in `tickets`.
+    Memoized on the frame, which load_all_tickets() replaces whenever the tickets change"""
+    key = id(tickets)
+    with _buckets_lock:
+        if key in _buckets:
+            return _buckets[key]
+    dated = tickets[tickets["date_received"].notna() & tickets["card_type"].isin(["Yellow", "Red"])]
+    days = dated["date_received"].dt.normalize()
+    users = pd.Index(dated["receiver"].astype(object).unique())
+    first = days.min() if len(days) else pd.Timestamp(datetime.date.today())
+    offsets = (days - first).dt.days.to_numpy()
+    n_days = int(offsets.max()) + 1 if len(offsets) else 0
+
+    # counts[kind, user, 1 + day]; the leading zero column makes every window a plain difference
+    counts = np.zeros((2, len(users), n_days + 1), dtype=np.int64)
+    kinds = (dated["card_type"] == "Red").to_numpy().astype(int)
+    np.add.at(counts, (kinds, users.get_indexer(dated["receiver"]), offsets + 1), 1)
+    buckets = {"users": users, "first": first, "days": n_days, "totals": counts.cumsum(axis=2)}
+    with _buckets_lock:
+        if key not in _buckets:
+            _buckets[key] = buckets
+            # No lock in the callback: it can run from a collection inside the block above
+            weakref.finalize(tickets, _buckets.pop, key, None)
+    return buckets
+
+def window_leaderboard(buckets, usernames, start, end):
+    """Yellows, reds and slacker score per user for cards received from `start` to `end` inclusive,
+    highest score first"""
+    first = buckets["first"]
+    lo = min(max((pd.Timestamp(start).normalize() - first).days, 0), buckets["days"])
+    hi = min(max((pd.Timestamp(end).normalize() - first).days + 1, 0), buckets["days"])
+    totals = buckets["totals"]
+    window = totals[:, :, hi] - totals[:, :, lo] if hi > lo else np.zeros(totals.shape[:2], dtype=np.int64)
+
+    board = pd.DataFrame({"yellows": window[0], "reds": window[1]}, index=buckets["users"])
+    board = board.reindex(pd.Index(list(usernames), name="username"), fill_value=0).reset_index()
+    board["slacker_score"] = board["yellows"] + board["reds"] * RED_WEIGHT
+    return board[LEADERBOARD_COLUMNS].sort_values("slacker_score", ascending=False, kind="stable")
+
+def card_labels(tickets):
+    """"receiver - type - date" labels for card pickers, aligned with the rows of `tickets`"""
+    dates = tickets["date_received"].dt.strftime("%Y-%m-%d")
+    return tickets["receiver"].astype(str) + " - " + tickets["card_type"].astype(str) + " - " + dates
+
+def filter_cards(tickets, receivers=None, card_types=None, statuses=None, start=None, end=None):
+    """Cards matching every non-empty filter; `start`/`end` bound date_received inclusively"""
+    mask = pd.Series(True, index=tickets.index)
+    if receivers:
+        mask &= tickets["receiver"].isin(receivers)
+    if card_types:
+        mask &= tickets["card_type"].isin(card_types)
+    if statuses:
+        mask &= tickets["status"].isin(statuses)
+    if start is not None:
+        mask &= tickets["date_received"] >= pd.Timestamp(start)
+    if end is not None:
+        mask &= tickets["date_received"] <= pd.Timestamp(end)
+    return tickets[mask]
+
+def page_of(df, page, page_size):
+    """Rows on 1-based `page` of `df` (clamped to the last page) and the total number of pages"""
+    pages = max(1, -(-len(df) // page_size))
+    page = min(max(page, 1), pages)
+    return df.iloc[(page - 1) * page_size:page * page_size], pages
@@ -1,28 +1,50 @@
 import datetime
 import os
 import uuid
-import requests
 import pandas as pd
 import streamlit as st
 
+from cards import (
+    YELLOW_EXPIRE_DAYS,
+    YELLOW_WARNING_DAYS,
+    card_labels,
+    daily_card_buckets,
+    days_until_expiry,
+    expire_and_convert,
+    filter_cards,
+    page_of,
+    window_leaderboard,
+)
+from notify import notification_stats, send_ntfy
+from rules import approval_index, required_approvers
+from storage import (
+    DEFAULT_HOUSEHOLD,
+    add_approval,
+    add_rule,
+    append_ticket_events,
+    card_deleted_event,
+    card_issued_event,
+    clear_approvals,
+    delete_rules,
+    finish_expiry_pass,
+    households,
+    load_all_tickets,
+    load_approvals,
+    load_rules,
+    load_tickets,
+    load_users,
+    map_households,
+    pending_expiry_pass,
+    read_ticket_audit,
+    run_expiry_pass,
+    ticket_events,
+    typed_tickets,
+    update_rule,
+    update_rules,
+    use_household,
+    user_counters,
+)
 
-# NTFY_TOPIC = os.environ.get("NTFY_TOPIC", "SlackerTracker")
-NTFY_TOPIC = "SlackerTracker"
-
-def send_ntfy(message: str, title: str | None = None, topic: str | None = None, priority: str = "high"):
-    """Send a notification via ntfy.sh. Uses `NTFY_TOPIC` env var if present."""
-    t = topic or NTFY_TOPIC
-    headers = {}
-    if title:
-        headers["Title"] = title
-    if priority:
-        headers["Priority"] = priority
-
-    try:
-        requests.post(f"https://ntfy.sh/{t}", data=message.encode("utf-8"), headers=headers, timeout=5)
-    except Exception:
-        # Best-effort notify; don't raise errors in app
-        pass
 
 # Add green approve box
 # Add red reject box - remove option & remove after
@@ -78,142 +100,47 @@ st.title("🟨🟥 Barnett St Slacker Tracker")
 
 # File paths
 ROOT = os.path.dirname(__file__)
-USERS_PKL = os.path.join(ROOT, "user_data.pkl")
-USERS_CSV = os.path.join(ROOT, "user_data.csv")
-TICKETS_PKL = os.path.join(ROOT, "tickets.pkl")
-TICKETS_CSV = os.path.join(ROOT, "tickets.csv")
-RULES_PKL = os.path.join(ROOT, "rules.pkl")
-RULES_CSV = os.path.join(ROOT, "rules.csv")
 RED_IMG = os.path.join(ROOT, "assets", "red_card.png")
 YELLOW_IMG = os.path.join(ROOT, "assets", "yellow_card.png")
 
-YELLOW_EXPIRE_DAYS = 30
-YELLOW_WARNING_DAYS = 7  # Warn when yellow cards have less than 7 days left
-
-
-def load_users():
-    if os.path.exists(USERS_PKL):
-        try:
-            return pd.read_pickle(USERS_PKL)
-        except Exception:
-            pass
-    if os.path.exists(USERS_CSV):
-        df = pd.read_csv(USERS_CSV)
-        try:
-            df.to_pickle(USERS_PKL)
-        except Exception:
-            pass
-        return df
-    return pd.DataFrame(columns=["username", "display_name", "password"])
-
-def load_tickets():
-    if os.path.exists(TICKETS_PKL):
-        try:
-            df = pd.read_pickle(TICKETS_PKL)
-            if "date_received" in df.columns:
-                df["date_received"] = pd.to_datetime(df["date_received"])
-            return df
-        except Exception:
-            pass
-    if os.path.exists(TICKETS_CSV):
-        df = pd.read_csv(TICKETS_CSV, parse_dates=["date_received"]) if os.path.getsize(TICKETS_CSV) > 0 else pd.DataFrame(
-            columns=["id", "receiver", "card_type", "date_received", "submitted_by", "status", "note"]
-        )
-        try:
-            df.to_pickle(TICKETS_PKL)
-        except Exception:
-            pass
-        return df
-    return pd.DataFrame(
-        columns=["id", "receiver", "card_type", "date_received", "submitted_by", "status", "note"]
-    )
+DELETE_PAGE_SIZE = 50  # Cards per page in the admin delete picker
+AUDIT_HISTORY_ROWS = 100  # Most recent audited card events shown on the admin page
 
-def save_tickets(df):
-    try:
-        df.to_pickle(TICKETS_PKL)
-    except Exception:
-        df.to_csv(TICKETS_CSV, index=False)
+def process_expirations_and_conversions(tickets):
+    df, changed, receivers = expire_and_convert(tickets)
 
-def load_rules():
-    if os.path.exists(RULES_PKL):
-        try:
-            df = pd.read_pickle(RULES_PKL)
-            return df
-        except Exception:
-            pass
-    if os.path.exists(RULES_CSV):
-        df = pd.read_csv(RULES_CSV) if os.path.getsize(RULES_CSV) > 0 else pd.DataFrame(
-            columns=["id", "text", "created_by", "status", "approvals", "proposed_by", "timestamp"]
-        )
+    # Notify via ntfy about auto-conversion
+    today = datetime.date.today()
+    for user in receivers:
         try:
-            df.to_pickle(RULES_PKL)
+            msg = f"Auto-converted: {user} received a Red card (from 3 Yellows) on {today}"
+            send_ntfy(msg, title="Auto-convert: Red card")
         except Exception:
             pass
-        return df
-    return pd.DataFrame(columns=["id", "text", "created_by", "status", "approvals", "proposed_by", "timestamp"])
-
-def save_rules(df):
-    try:
-        df.to_pickle(RULES_PKL)
-    except Exception:
-        df.to_csv(RULES_CSV, index=False)
-
-def process_expirations_and_conversions(tickets):
-    changed = False
-    df = tickets.copy()
-    today = pd.Timestamp(datetime.date.today())
-    df["date_received"] = pd.to_datetime(df["date_received"]).dt.normalize()
-
-    # Expire old yellows
-    mask_yellow_active = (df["card_type"] == "Yellow") & (df["status"] == "active")
-    expire_mask = mask_yellow_active & (df["date_received"] < (today - pd.Timedelta(days=YELLOW_EXPIRE_DAYS)))
-    if expire_mask.any():
-        df.loc[expire_mask, "status"] = "expired"
-        changed = True
-
-    # Convert groups of 3 active yellows into reds
-    for user in df["receiver"].unique():
-        user_mask = (df["receiver"] == user) & (df["card_type"] == "Yellow") & (df["status"] == "active")
-        active_yellows = df[user_mask].sort_values("date_received")
-        while len(active_yellows) >= 3:
-            to_convert = active_yellows.iloc[:3]
-            df.loc[df["id"].isin(to_convert["id"]), "status"] = "converted"
-
-            new_red = {
-                "id": str(uuid.uuid4()),
-                "receiver": user,
-                "card_type": "Red",
-                "date_received": today.strftime("%Y-%m-%d"),
-                "submitted_by": "system",
-                "status": "active",
-                "note": "Auto-converted from 3 yellows",
-            }
-            df = pd.concat([pd.DataFrame([new_red]), df], ignore_index=True)
-            changed = True
 
-            # Notify via ntfy about auto-conversion
-            try:
-                msg = f"Auto-converted: {user} received a Red card (from 3 Yellows) on {today.date()}"
-                send_ntfy(msg, title="Auto-convert: Red card")
-            except Exception:
-                pass
-
-            user_mask = (df["receiver"] == user) & (df["card_type"] == "Yellow") & (df["status"] == "active")
-            active_yellows = df[user_mask].sort_values("date_received")
-
-    df["date_received"] = pd.to_datetime(df["date_received"]).dt.date
-    return df, changed
-
-def get_days_until_expiry(date_received):
-    """Calculate days until a yellow card expires"""
-    if pd.isna(date_received):
+    return typed_tickets(df), changed
+
+def event_changes(events, labels):
+    """One row per changed field for the admin change tables, plus one per deleted card.
+    Audited events also get when and by whom"""
+    rows = []
+    for e in events:
+        card = labels.get(e["id"], e["id"])
+        meta = {"When": e["at"][:16].replace("T", " "), "By": e["by"]} if "by" in e else {}
+        if e["event"] == "card_deleted":
+            rows.append({**meta, "Card": card, "Field": "", "Before": "", "After": "deleted"})
+        elif "before" in e:
+            for field, value in (e["changes"] if "changes" in e else {"status": e["status"]}).items():
+                rows.append({**meta, "Card": card, "Field": field, "Before": e["before"].get(field), "After": value})
+    return rows
+
+def next_yellow_expiry(tickets):
+    """The first day on which one of the active yellows in `tickets` will have expired"""
+    active_yellows = tickets[(tickets["card_type"] == "Yellow") & (tickets["status"] == "active")]
+    if active_yellows.empty:
         return None
-    today = datetime.date.today()
-    if isinstance(date_received, str):
-        date_received = pd.to_datetime(date_received).date()
-    expiry_date = date_received + datetime.timedelta(days=YELLOW_EXPIRE_DAYS)
-    days_left = (expiry_date - today).days
-    return days_left
+    oldest = active_yellows["date_received"].min().normalize()
+    return oldest + pd.Timedelta(days=YELLOW_EXPIRE_DAYS + 1)
 
 def format_status_badge(status):
     """Return a formatted status badge"""
@@ -225,29 +152,26 @@ def format_status_badge(status):
         return "🔄 Converted"
     return status
 
-def approvals_to_list(approvals_str):
-    if pd.isna(approvals_str) or approvals_str is None or approvals_str == "":
-        return []
-    return [s for s in str(approvals_str).split(";") if s.strip() != ""]
-
-def list_to_approvals(lst):
-    if not lst:
-        return ""
-    return ";".join(sorted(set(lst)))
-
-def get_required_approvers(proposer):
-    # All non-admin users, excluding proposer
-    all_users = [u for u in users_df["username"].tolist() if u != "admin"]
-    # If users file doesn't include admin, no problem; admin is excluded anyway
-    req = set(all_users) - {proposer}
-    return sorted(req)
-
-def is_fully_approved(approvals_list, proposer):
-    required = set(get_required_approvers(proposer))
-    return required.issubset(set(approvals_list))
+def household_overview():
+    """Card counts and top slacker for the current household, for the cross-house admin view"""
+    tickets = load_all_tickets()
+    scores = user_counters(load_users()["username"]).sort_values("slacker_score", ascending=False, kind="stable")
+    top = scores[scores["slacker_score"] > 0]
+    return {
+        "Users": len(scores),
+        "Total Cards": len(tickets),
+        "Active": int((tickets["status"] == "active").sum()),
+        "Expired": int((tickets["status"] == "expired").sum()),
+        "Converted": int((tickets["status"] == "converted").sum()),
+        "Top Slacker": top["username"].iloc[0] if len(top) else "—",
+    }
 
 
 
+# Each household is its own shard of the store; only the one picked at login is loaded
+if "household" not in st.session_state:
+    st.session_state.household = DEFAULT_HOUSEHOLD
+use_household(st.session_state.household)
 
 users_df = load_users()
 tickets_df = load_tickets()
@@ -256,18 +180,20 @@ rules_df = load_rules()
 # Initialize session state
 if "user" not in st.session_state:
     st.session_state.user = None
-if "tickets" not in st.session_state:
-    st.session_state.tickets = tickets_df
 if "show_success" not in st.session_state:
     st.session_state.show_success = None
-if "rules" not in st.session_state:
-    st.session_state.rules = rules_df
 
-# Process expirations/conversions on load
-processed, changed = process_expirations_and_conversions(st.session_state.tickets)
-if changed:
-    st.session_state.tickets = processed
-    save_tickets(processed)
+# Every session points at the same cached frames; writes go through storage,
+# which refreshes the cache for the next rerun
+st.session_state.tickets = tickets_df
+st.session_state.rules = rules_df
+
+# Process expirations/conversions on load, but only once a yellow is due or new ones were added
+expiry_stamp = pending_expiry_pass(pd.Timestamp(datetime.date.today()))
+if expiry_stamp is not None:
+    # Storage reloads the tickets and holds the write lock, so concurrent passes can't double-convert
+    st.session_state.tickets = run_expiry_pass(process_expirations_and_conversions)
+    finish_expiry_pass(expiry_stamp, next_yellow_expiry(st.session_state.tickets))
 
 def login_page():
     # Center the login form
@@ -275,6 +201,16 @@ def login_page():
     
     with col2:
         st.markdown("### Login")
+
+        houses = households()
+        if len(houses) > 1:
+            st.selectbox(
+                "Household",
+                houses,
+                index=houses.index(st.session_state.household),
+                key="login_household",
+                on_change=lambda: st.session_state.update(household=st.session_state.login_household),
+            )
         
         if users_df.empty:
             st.error("No users found in user_data.csv. Please create users first.")
@@ -352,6 +288,8 @@ def add_card_page():
             "note": note,
         }
         st.session_state.tickets = pd.concat([pd.DataFrame([new_ticket]), st.session_state.tickets], ignore_index=True)
+        # Any expiry or conversion this causes is picked up by the pass on the rerun below
+        append_ticket_events([card_issued_event(new_ticket)])
 
         # Notify about new card
         try:
@@ -360,10 +298,6 @@ def add_card_page():
         except Exception:
             pass
 
-        processed, changed = process_expirations_and_conversions(st.session_state.tickets)
-        st.session_state.tickets = processed
-        save_tickets(processed)
-
         st.session_state.show_success = f"✅ {card_type} card added for {receiver}"
         st.session_state.page = "Existing Cards"
         st.rerun()
@@ -379,25 +313,15 @@ def existing_cards_page():
     
     st.markdown("### Cards Dashboard")
     
-    df = st.session_state.tickets.copy()
-    df["date_received"] = pd.to_datetime(df["date_received"]).dt.date
-
-    # Calculate all-time statistics for biggest slackers
-    slacker_data = []
-    for u in users_df["username"]:
-        user_rows = df[df["receiver"] == u]
-        total_yellows = len(user_rows[user_rows["card_type"] == "Yellow"])
-        total_reds = len(user_rows[user_rows["card_type"] == "Red"])
-        slacker_score = total_yellows + (total_reds * 3)  # Weight reds more heavily
-        
-        slacker_data.append({
-            "username": u,
-            "total_yellows": total_yellows,
-            "total_reds": total_reds,
-            "slacker_score": slacker_score
-        })
-    
-    slacker_df = pd.DataFrame(slacker_data).sort_values("slacker_score", ascending=False)
+    # All-time stats and the All Cards table need the archive too; active cards only live in the
+    # hot set. assign() shares the cached columns rather than copying them
+    history = load_all_tickets()
+    df = history.assign(days_until_expiry=days_until_expiry(history))
+    hot = st.session_state.tickets
+
+    # All-time statistics and current counts for every user, from the materialized counters
+    summary_df = user_counters(users_df["username"])
+    slacker_df = summary_df.sort_values("slacker_score", ascending=False, kind="stable")
     
     # Display Biggest Slackers
     st.markdown("#### 🏆 Biggest Slackers (All Time)")
@@ -420,31 +344,32 @@ def existing_cards_page():
     
     st.markdown("---")
 
-    # Summary metrics
-    summary_data = []
-    for u in users_df["username"]:
-        user_rows = df[df["receiver"] == u]
-        active_yellows = len(user_rows[(user_rows["card_type"] == "Yellow") & (user_rows["status"] == "active")])
-        active_reds = len(user_rows[(user_rows["card_type"] == "Red") & (user_rows["status"] == "active")])
-        
-        # Check for cards about to expire
-        yellows_expiring = 0
-        if active_yellows > 0:
-            yellow_rows = user_rows[(user_rows["card_type"] == "Yellow") & (user_rows["status"] == "active")]
-            for _, row in yellow_rows.iterrows():
-                days_left = get_days_until_expiry(row["date_received"])
-                if days_left is not None and 0 < days_left <= YELLOW_WARNING_DAYS:
-                    yellows_expiring += 1
-        
-        summary_data.append({
-            "username": u,
-            "yellow_active": active_yellows,
-            "red_active": active_reds,
-            "penalties": active_reds,
-            "yellows_expiring": yellows_expiring
-        })
-
-    summary_df = pd.DataFrame(summary_data)
+    # Windowed leaderboards, read from per-day running totals rather than the raw history
+    st.markdown("#### 📅 Leaderboards")
+    today = datetime.date.today()
+    window = st.radio("Period", ["This Week", "This Month", "Custom Range"], horizontal=True, key="leaderboard_window")
+    if window == "This Week":
+        start, end = today - datetime.timedelta(days=today.weekday()), today
+    elif window == "This Month":
+        start, end = today.replace(day=1), today
+    else:
+        board_range = st.date_input("Range", value=(today - datetime.timedelta(days=29), today), key="leaderboard_range")
+        start, end = (board_range[0], board_range[-1]) if len(board_range) > 0 else (today, today)
+    board = window_leaderboard(daily_card_buckets(history), users_df["username"], start, end)
+    board = board[board["slacker_score"] > 0].reset_index(drop=True)
+    if len(board) > 0:
+        board = board.rename(columns={"username": "User", "yellows": "🟨 Yellows", "reds": "🟥 Reds", "slacker_score": "Score"})
+        board.insert(0, "Rank", range(1, len(board) + 1))
+        st.dataframe(board, use_container_width=True, hide_index=True)
+    else:
+        st.info(f"No cards received between {start:%Y-%m-%d} and {end:%Y-%m-%d}.")
+
+    st.markdown("---")
+
+    # Active cards grouped once, newest first, rather than filtered per user
+    active_cards = hot[hot["status"] == "active"].sort_values("date_received", ascending=False)
+    active_cards = active_cards.assign(days_until_expiry=days_until_expiry(active_cards))
+    active_by_user = dict(tuple(active_cards.groupby("receiver", sort=False)))
     
     # Display metrics in columns
     st.markdown("#### User Summary")
@@ -470,16 +395,18 @@ def existing_cards_page():
             # Show warning if cards are expiring
             if row['yellows_expiring'] > 0:
                 st.warning(f"⚠️ {row['yellows_expiring']} yellow card(s) expiring within {YELLOW_WARNING_DAYS} days!")
+            if pd.notna(row['next_expiry']):
+                st.caption(f"Next yellow expires {row['next_expiry']:%Y-%m-%d}")
             
             # Show active cards for this user
-            user_active_cards = df[(df["receiver"] == user) & (df["status"] == "active")].sort_values("date_received", ascending=False)
+            user_active_cards = active_by_user.get(user, active_cards.iloc[:0])
             
             if len(user_active_cards) > 0:
                 st.markdown("**Active Cards:**")
                 
                 for _, card in user_active_cards.iterrows():
                     card_type_emoji = "🟨" if card["card_type"] == "Yellow" else "🟥"
-                    days_left = get_days_until_expiry(card["date_received"]) if card["card_type"] == "Yellow" else None
+                    days_left = None if pd.isna(card["days_until_expiry"]) else int(card["days_until_expiry"])
                     
                     # Color code based on expiry
                     if days_left is not None:
@@ -498,23 +425,47 @@ def existing_cards_page():
                     
                     st.markdown(f"""
                     <div style='background-color: {bg_color}; padding: 10px; border-radius: 5px; border-left: 4px solid {border_color}; margin: 5px 0;'>
-                        <strong>{card_type_emoji} {card["card_type"]}</strong> — Received: {card["date_received"]}{expiry_text}{note_text}
+                        <strong>{card_type_emoji} {card["card_type"]}</strong> — Received: {card["date_received"]:%Y-%m-%d}{expiry_text}{note_text}
                     </div>
                     """, unsafe_allow_html=True)
             else:
                 st.info("No active cards")
 
     st.markdown("---")
-    # Prepare a display dataframe copy
-    display_df = df.copy()
-
-    display_df["days_until_expiry"] = display_df.apply(
-        lambda row: get_days_until_expiry(row["date_received"]) if row["card_type"] == "Yellow" and row["status"] == "active" else None,
-        axis=1
-    )
-    
-    # Format status with badges
-    display_df["status_badge"] = display_df["status"].apply(format_status_badge)
+    st.markdown(f"#### All Cards (Total: {len(df)})")
+
+    # Filter, sort and page the history here so only one page is sent to the browser
+    fcol1, fcol2, fcol3, fcol4 = st.columns(4)
+    with fcol1:
+        filter_users = st.multiselect("User", users_df["username"].tolist(), key="cards_filter_users")
+    with fcol2:
+        filter_types = st.multiselect("Card Type", ["Yellow", "Red"], key="cards_filter_types")
+    with fcol3:
+        filter_statuses = st.multiselect("Status", ["active", "expired", "converted"], format_func=format_status_badge, key="cards_filter_statuses")
+    with fcol4:
+        date_range = st.date_input("Date range", value=(), key="cards_filter_dates")
+    start, end = (date_range[0], date_range[-1]) if len(date_range) > 0 else (None, None)
+
+    matching = filter_cards(df, filter_users, filter_types, filter_statuses, start, end)
+    matching = matching.sort_values("date_received", ascending=False, kind="stable")
+
+    pcol1, pcol2, pcol3 = st.columns([1, 1, 2])
+    with pcol1:
+        page_size = st.selectbox("Rows per page", [25, 50, 100, 250], key="cards_page_size")
+    pages = max(1, -(-len(matching) // page_size))
+    if st.session_state.get("cards_page", 1) > pages:
+        st.session_state.cards_page = pages
+    with pcol2:
+        page = st.number_input("Page", min_value=1, max_value=pages, step=1, key="cards_page")
+    page_df, pages = page_of(matching, page, page_size)
+    with pcol3:
+        offset = (page - 1) * page_size
+        st.caption(f"Showing {offset + 1 if len(page_df) else 0}–{offset + len(page_df)} of {len(matching)} matching cards (page {page} of {pages})")
+
+    # Format only the rows on this page for display
+    display_df = page_df.copy()
+    display_df["date_received"] = display_df["date_received"].dt.date
+    display_df["status_badge"] = display_df["status"].map(format_status_badge)
     
     # Reorder and select columns for display
     display_columns = ["receiver", "card_type", "status_badge", "date_received", "days_until_expiry", "submitted_by", "note"]
@@ -523,15 +474,13 @@ def existing_cards_page():
     # Rename columns for better display
     display_df.columns = ["User", "Card Type", "Status", "Date Received", "Days Left", "Submitted By", "Note"]
     
-    st.markdown(f"#### All Cards (Total: {len(display_df)})")
-    
     # Style the dataframe
     def highlight_expiring(row):
-        if row["Days Left"] is not None and 0 < row["Days Left"] <= YELLOW_WARNING_DAYS:
+        if pd.notna(row["Days Left"]) and 0 < row["Days Left"] <= YELLOW_WARNING_DAYS:
             return ['background-color: #fff3cd'] * len(row)
         return [''] * len(row)
     
-    styled_df = display_df.sort_values("Date Received", ascending=False).reset_index(drop=True)
+    styled_df = display_df.reset_index(drop=True)
     
     st.dataframe(
         styled_df,
@@ -557,7 +506,8 @@ def existing_cards_page():
 def admin_page():
     st.markdown("### Admin — Manage Cards")
     
-    df = st.session_state.tickets.copy()
+    # Live and archived cards; read-only, edits come back from the data editor as a new frame
+    df = load_all_tickets()
 
     # Statistics
     col1, col2, col3, col4 = st.columns(4)
@@ -570,11 +520,38 @@ def admin_page():
     with col4:
         st.metric("🔄 Converted Cards", len(df[df["status"] == "converted"]))
 
+    # Every household side by side, each shard loaded on its own worker thread
+    if len(households()) > 1:
+        st.markdown("#### 🏠 All Households")
+        overview = pd.DataFrame.from_dict(map_households(household_overview), orient="index")
+        st.dataframe(overview.rename_axis("Household").reset_index(), use_container_width=True, hide_index=True)
+
+    # Notification delivery
+    ntfy = notification_stats()
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        st.metric("📨 Queued Notifications", ntfy["queued"] + ntfy["in_digest"])
+    with col2:
+        st.metric("✅ Sent", ntfy["sent"])
+    with col3:
+        st.metric("❌ Failed / Dropped", f"{ntfy['failed']} / {ntfy['dropped']}")
+    with col4:
+        st.metric("⏱️ Avg Delivery", f"{ntfy['avg_latency']:.1f}s" if ntfy["avg_latency"] is not None else "—")
+
     st.markdown("---")
     
     # Edit cards section
     with st.expander("Edit Cards", expanded=True):
         st.info("Make changes in the table below and click 'Save Changes' to apply them.")
+        saved = st.session_state.pop("admin_saved", None)
+        if saved:
+            labels = dict(zip(df["id"], card_labels(df)))
+            changes = event_changes(saved, labels)
+            st.success(f"✅ Saved {len(saved)} change(s)")
+            if changes:
+                st.dataframe(pd.DataFrame(changes), use_container_width=True, hide_index=True)
+        elif saved is not None:
+            st.info("No changes to save.")
         edited = st.data_editor(
             df,
             use_container_width=True,
@@ -593,23 +570,52 @@ def admin_page():
                 save_submitted = st.form_submit_button("Save Changes", use_container_width=True, type="primary")
         
         if save_submitted:
-            st.session_state.tickets = edited
-            save_tickets(edited)
-            st.success("✅ Changes saved successfully!")
+            # Only the rows that actually changed are written, as one batch
+            events = ticket_events(df, edited)
+            if events:
+                # Also kept in the audit trail, which outlives the event log
+                append_ticket_events(events, audit_by=st.session_state.user)
+            st.session_state.admin_saved = events
             st.rerun()
 
+    # Every audited admin change, newest first
+    with st.expander("Change History"):
+        audit = read_ticket_audit(AUDIT_HISTORY_ROWS)[::-1]
+        changes = event_changes(audit, dict(zip(df["id"], card_labels(df))))
+        if changes:
+            st.dataframe(pd.DataFrame(changes), use_container_width=True, hide_index=True)
+        else:
+            st.info("No admin changes recorded yet.")
+
     # Delete cards section
     with st.expander("Delete Cards"):
         st.warning("**Warning:** Deleted cards cannot be recovered!")
         
-        ids = df["id"].tolist()
-        card_labels = [f"{df.loc[df['id']==id, 'receiver'].values[0]} - {df.loc[df['id']==id, 'card_type'].values[0]} - {df.loc[df['id']==id, 'date_received'].values[0]}" for id in ids]
+        # Labels are built in one pass and looked up by id
+        labels = card_labels(df)
+        label_by_id = dict(zip(df["id"], labels))
+
+        search = st.text_input("Search cards", placeholder="User, card type, date or note", key="delete_search")
+        candidates = df
+        if search:
+            haystack = labels + " " + df["note"].fillna("").astype(str)
+            candidates = df[haystack.str.contains(search, case=False, regex=False)]
+
+        pages = max(1, -(-len(candidates) // DELETE_PAGE_SIZE))
+        if st.session_state.get("delete_page", 1) > pages:
+            st.session_state.delete_page = pages
+        col1, col2 = st.columns([1, 3])
+        with col1:
+            page = st.number_input("Page", min_value=1, max_value=pages, step=1, key="delete_page")
+        page_df, pages = page_of(candidates, page, DELETE_PAGE_SIZE)
+        with col2:
+            st.caption(f"{len(candidates)} matching cards, page {page} of {pages}")
         
         with st.form("delete_form"):
             to_delete = st.multiselect(
                 "Select cards to delete",
-                options=ids,
-                format_func=lambda x: card_labels[ids.index(x)]
+                options=page_df["id"].tolist(),
+                format_func=label_by_id.get
             )
             
             col1, col2 = st.columns([1, 4])
@@ -620,16 +626,21 @@ def admin_page():
             if not to_delete:
                 st.warning("No cards selected for deletion")
             else:
-                new_df = df[~df["id"].isin(to_delete)].reset_index(drop=True)
-                st.session_state.tickets = new_df
-                save_tickets(new_df)
+                hot = st.session_state.tickets
+                st.session_state.tickets = hot[~hot["id"].isin(to_delete)].reset_index(drop=True)
+                append_ticket_events([card_deleted_event(tid) for tid in to_delete], audit_by=st.session_state.user)
                 st.success(f"✅ Successfully deleted {len(to_delete)} rule(s)")
                 st.rerun()
 
 def house_rules_page():
     st.markdown("### House Rules")
 
-    df = st.session_state.rules.copy()
+    # Read-only view of the shared frame; rule actions go through the storage rule API
+    df = st.session_state.rules
+    votes = approval_index(rules_df, load_approvals(), users_df)
+    awaiting = votes["awaiting"].get(st.session_state.user, set())
+    if awaiting:
+        st.info(f"🗳️ {len(awaiting)} rule change(s) waiting for your vote")
 
     # Add new rule
     if "new_rule_text" not in st.session_state:
@@ -649,13 +660,12 @@ def house_rules_page():
                 "id": str(uuid.uuid4()),
                 "text": new_rule_text.strip(),
                 "created_by": created_by,
-                "status": "active" if (created_by == "admin" or len(get_required_approvers(created_by)) == 0) else "pending_add",
+                "status": "active" if (created_by == "admin" or len(required_approvers(users_df, created_by)) == 0) else "pending_add",
                 "approvals": "" if created_by != "admin" else "",
                 "proposed_by": created_by if created_by != "admin" else "",
                 "timestamp": datetime.datetime.utcnow().isoformat(),
             }
-            st.session_state.rules = pd.concat([pd.DataFrame([new_rule]), st.session_state.rules], ignore_index=True)
-            save_rules(st.session_state.rules)
+            add_rule(new_rule)
 
             # Notify about the new rule or proposal
             try:
@@ -715,30 +725,20 @@ def house_rules_page():
             else:
                 if st.session_state.user == 'admin':
                     # Admin deletes immediately
-                    new_df = st.session_state.rules[~st.session_state.rules['id'].isin(to_remove)].reset_index(drop=True)
-                    st.session_state.rules = new_df
-                    save_rules(new_df)
+                    delete_rules(to_remove)
+                    clear_approvals(to_remove)
                     st.success(f"✅ Deleted {len(to_remove)} rule(s)")
                     # clear selection
                     st.session_state.propose_remove_list = []
                     st.rerun()
                 else:
-                    removed_texts = []
-                    for rid in to_remove:
-                        required = get_required_approvers(st.session_state.user)
-                        if len(required) == 0:
-                            # delete immediately
-                            removed_row = st.session_state.rules[st.session_state.rules['id'] == rid]
-                            if not removed_row.empty:
-                                removed_texts.append(removed_row.iloc[0]['text'])
-                            st.session_state.rules = st.session_state.rules[st.session_state.rules['id'] != rid].reset_index(drop=True)
-                        else:
-                            row_text = st.session_state.rules.loc[st.session_state.rules['id'] == rid, 'text'].iloc[0]
-                            removed_texts.append(row_text)
-                            st.session_state.rules.loc[st.session_state.rules['id'] == rid, 'status'] = 'pending_remove'
-                            st.session_state.rules.loc[st.session_state.rules['id'] == rid, 'proposed_by'] = st.session_state.user
-                            st.session_state.rules.loc[st.session_state.rules['id'] == rid, 'approvals'] = ''
-                    save_rules(st.session_state.rules)
+                    removed_texts = [label_map[rid] for rid in to_remove]
+                    if len(required_approvers(users_df, st.session_state.user)) == 0:
+                        # delete immediately
+                        delete_rules(to_remove)
+                    else:
+                        update_rules(to_remove, status='pending_remove', proposed_by=st.session_state.user)
+                    clear_approvals(to_remove)
                     # Notify about removal proposals
                     try:
                         if removed_texts:
@@ -761,9 +761,9 @@ def house_rules_page():
         for _, row in pending_adds.iterrows():
             st.markdown(f"**• {row['text']}**  ")
             st.caption(f"Proposed by: {row['proposed_by']}")
-            approvals_list = approvals_to_list(row['approvals'])
+            approvals_list = votes["approvers"].get(row['id'], [])
             st.write(f"Approvals: {', '.join(approvals_list) if approvals_list else 'None yet'}")
-            req_list = get_required_approvers(row['proposed_by'])
+            req_list = votes["required"].get(row['id'], [])
             st.write(f"Required approvals: {len(req_list)} — {', '.join(req_list) if req_list else 'No other users'}")
 
             # Admin can activate immediately, with reject option
@@ -771,10 +771,8 @@ def house_rules_page():
                 colA, colB = st.columns([1,1])
                 with colA:
                     if st.button(f"✅ Activate (Admin) - {row['id']}", key=f"activate-{row['id']}"):
-                        st.session_state.rules.loc[st.session_state.rules['id'] == row['id'], 'status'] = 'active'
-                        st.session_state.rules.loc[st.session_state.rules['id'] == row['id'], 'approvals'] = ''
-                        st.session_state.rules.loc[st.session_state.rules['id'] == row['id'], 'proposed_by'] = ''
-                        save_rules(st.session_state.rules)
+                        update_rule(row['id'], status='active', proposed_by='')
+                        clear_approvals([row['id']])
                         # Notify about activation
                         try:
                             send_ntfy(f"Rule activated by admin: {row['text']}", title="Rule activated")
@@ -784,10 +782,8 @@ def house_rules_page():
                         st.rerun()
                 with colB:
                     if st.button(f"❌ Reject (Admin) - {row['id']}", key=f"reject-add-admin-{row['id']}"):
-                        st.session_state.rules.loc[st.session_state.rules['id'] == row['id'], 'status'] = 'rejected'
-                        st.session_state.rules.loc[st.session_state.rules['id'] == row['id'], 'proposed_by'] = ''
-                        st.session_state.rules.loc[st.session_state.rules['id'] == row['id'], 'approvals'] = ''
-                        save_rules(st.session_state.rules)
+                        update_rule(row['id'], status='rejected', proposed_by='')
+                        clear_approvals([row['id']])
                         try:
                             send_ntfy(f"Rule proposal rejected by admin: {row['text']}", title="Rule rejected")
                         except Exception:
@@ -796,31 +792,24 @@ def house_rules_page():
                         st.rerun()
             else:
                 # Show approve/reject buttons if current user is required approver
-                required = get_required_approvers(row['proposed_by'])
-                if st.session_state.user in required and st.session_state.user not in approvals_list:
+                if row['id'] in awaiting:
                     colA, colB = st.columns([1,1])
                     with colA:
                         if st.button(f"✅ Approve - {row['id']}", key=f"approve-add-{row['id']}"):
-                            approvals_list.append(st.session_state.user)
-                            st.session_state.rules.loc[st.session_state.rules['id'] == row['id'], 'approvals'] = list_to_approvals(approvals_list)
-                            # If fully approved, set active
-                            if is_fully_approved(approvals_list, row['proposed_by']):
-                                st.session_state.rules.loc[st.session_state.rules['id'] == row['id'], 'status'] = 'active'
-                                st.session_state.rules.loc[st.session_state.rules['id'] == row['id'], 'proposed_by'] = ''
-                                st.session_state.rules.loc[st.session_state.rules['id'] == row['id'], 'approvals'] = ''
+                            # If this was the last outstanding vote, set active
+                            if add_approval(row['id'], st.session_state.user) == 0:
+                                update_rule(row['id'], status='active', proposed_by='')
+                                clear_approvals([row['id']])
                                 try:
                                     send_ntfy(f"Rule activated: {row['text']}", title="Rule activated")
                                 except Exception:
                                     pass
-                            save_rules(st.session_state.rules)
                             st.success("✅ Approved")
                             st.rerun()
                     with colB:
                         if st.button(f"❌ Reject - {row['id']}", key=f"reject-add-{row['id']}"):
-                            st.session_state.rules.loc[st.session_state.rules['id'] == row['id'], 'status'] = 'rejected'
-                            st.session_state.rules.loc[st.session_state.rules['id'] == row['id'], 'proposed_by'] = ''
-                            st.session_state.rules.loc[st.session_state.rules['id'] == row['id'], 'approvals'] = ''
-                            save_rules(st.session_state.rules)
+                            update_rule(row['id'], status='rejected', proposed_by='')
+                            clear_approvals([row['id']])
                             try:
                                 send_ntfy(f"Rule proposal rejected by {st.session_state.user}: {row['text']}", title="Rule rejected")
                             except Exception:
@@ -839,17 +828,16 @@ def house_rules_page():
         for _, row in pending_removes.iterrows():
             st.markdown(f"**• {row['text']}**  ")
             st.caption(f"Removal proposed by: {row['proposed_by']}")
-            approvals_list = approvals_to_list(row['approvals'])
+            approvals_list = votes["approvers"].get(row['id'], [])
             st.write(f"Approvals: {', '.join(approvals_list) if approvals_list else 'None yet'}")
-            req_list = get_required_approvers(row['proposed_by'])
+            req_list = votes["required"].get(row['id'], [])
             st.write(f"Required approvals: {len(req_list)} — {', '.join(req_list) if req_list else 'No other users'}")
             if st.session_state.user == 'admin':
                 colA, colB = st.columns([1,1])
                 with colA:
                     if st.button(f"🗑️ Delete (Admin) - {row['id']}", key=f"del-pen-{row['id']}"):
-                        new_df = st.session_state.rules[st.session_state.rules['id'] != row['id']].reset_index(drop=True)
-                        st.session_state.rules = new_df
-                        save_rules(new_df)
+                        delete_rules([row['id']])
+                        clear_approvals([row['id']])
                         try:
                             send_ntfy(f"Rule deleted by admin: {row['text']}", title="Rule deleted")
                         except Exception:
@@ -859,10 +847,8 @@ def house_rules_page():
                 with colB:
                     if st.button(f"❌ Reject (Admin) - {row['id']}", key=f"reject-rem-admin-{row['id']}"):
                         # Cancel removal request, restore active status
-                        st.session_state.rules.loc[st.session_state.rules['id'] == row['id'], 'status'] = 'active'
-                        st.session_state.rules.loc[st.session_state.rules['id'] == row['id'], 'proposed_by'] = ''
-                        st.session_state.rules.loc[st.session_state.rules['id'] == row['id'], 'approvals'] = ''
-                        save_rules(st.session_state.rules)
+                        update_rule(row['id'], status='active', proposed_by='')
+                        clear_approvals([row['id']])
                         try:
                             send_ntfy(f"Removal request rejected by admin for rule: {row['text']}", title="Removal request rejected")
                         except Exception:
@@ -870,38 +856,35 @@ def house_rules_page():
                         st.success("❌ Removal request rejected (restored)")
                         st.rerun()
             else:
-                required = get_required_approvers(row['proposed_by'])
-                if st.session_state.user in required and st.session_state.user not in approvals_list:
+                if row['id'] in awaiting:
                     colA, colB = st.columns([1,1])
                     with colA:
                         if st.button(f"✅ Approve Removal - {row['id']}", key=f"approve-rem-{row['id']}"):
-                            approvals_list.append(st.session_state.user)
-                            if is_fully_approved(approvals_list, row['proposed_by']):
+                            outstanding = add_approval(row['id'], st.session_state.user)
+                            if outstanding == 0:
                                 # delete
-                                new_df = st.session_state.rules[st.session_state.rules['id'] != row['id']].reset_index(drop=True)
-                                st.session_state.rules = new_df
-                                save_rules(new_df)
+                                delete_rules([row['id']])
+                                clear_approvals([row['id']])
                                 try:
                                     send_ntfy(f"Rule removed: {row['text']}", title="Rule removed")
                                 except Exception:
                                     pass
                                 st.success("✅ Rule removed")
                                 st.rerun()
-                            else:
-                                st.session_state.rules.loc[st.session_state.rules['id'] == row['id'], 'approvals'] = list_to_approvals(approvals_list)
-                                save_rules(st.session_state.rules)
+                            elif outstanding is not None:
                                 try:
                                     send_ntfy(f"Removal approved by {st.session_state.user} for rule: {row['text']}", title="Removal approval")
                                 except Exception:
                                     pass
                                 st.success("✅ Removal approved")
                                 st.rerun()
+                            else:
+                                # Another vote already settled it; just refresh
+                                st.rerun()
                     with colB:
                         if st.button(f"❌ Reject Removal - {row['id']}", key=f"reject-rem-{row['id']}"):
-                            st.session_state.rules.loc[st.session_state.rules['id'] == row['id'], 'status'] = 'active'
-                            st.session_state.rules.loc[st.session_state.rules['id'] == row['id'], 'proposed_by'] = ''
-                            st.session_state.rules.loc[st.session_state.rules['id'] == row['id'], 'approvals'] = ''
-                            save_rules(st.session_state.rules)
+                            update_rule(row['id'], status='active', proposed_by='')
+                            clear_approvals([row['id']])
                             st.success("❌ Removal request rejected (restored)")
                             st.rerun()
 
@@ -914,6 +897,8 @@ def main():
     # Sidebar
     with st.sidebar:
         st.markdown(f"### {st.session_state.user}")
+        if len(households()) > 1:
+            st.caption(f"🏠 {st.session_state.household}")
         st.markdown("---")
         
         # Navigation
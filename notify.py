@@ -0,0 +1,181 @@
+import atexit
+import collections
+import os
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+NTFY_TOPIC = os.environ.get("NTFY_TOPIC", "SlackerTracker")
+NTFY_SERVER = os.environ.get("NTFY_SERVER", "https://ntfy.sh").rstrip("/")
+
+# Connection pooling: one keep-alive session is reused for every notification
+POOL_CONNECTIONS = int(os.environ.get("NTFY_POOL_CONNECTIONS", "2"))  # hosts to keep pools for
+POOL_MAXSIZE = int(os.environ.get("NTFY_POOL_MAXSIZE", "4"))  # open connections per host
+
+# Delivery queue
+QUEUE_SIZE = 200
+OVERFLOW_POLICY = "drop_oldest"  # or "drop_newest"
+MAX_ATTEMPTS = 4
+BACKOFF_SECONDS = 1.0  # doubled after every failed attempt
+REQUEST_TIMEOUT = 5
+
+# Digest mode: with a window > 0, notifications for a topic are held for that
+# many seconds after the first one arrives and then sent as one combined message
+DIGEST_SECONDS = float(os.environ.get("NTFY_DIGEST_SECONDS", "0"))
+PRIORITY_ORDER = ["min", "low", "default", "high", "urgent"]
+
+_pending = collections.deque()
+_digests = {}  # topic -> {"due": monotonic deadline, "items": [...]}
+_lock = threading.Condition()
+_worker = None
+_busy = False
+_session = None
+_transport = None
+_stats = {"sent": 0, "failed": 0, "dropped": 0, "retries": 0, "last_latency": None, "total_latency": 0.0}
+
+
+def send_ntfy(message: str, title: str | None = None, topic: str | None = None, priority: str = "high"):
+    """Queue a notification for ntfy.sh and return straight away; a background thread delivers it"""
+    item = (time.monotonic(), message, title, topic or NTFY_TOPIC, priority)
+    with _lock:
+        if DIGEST_SECONDS > 0:
+            digest = _digests.setdefault(item[3], {"due": item[0] + DIGEST_SECONDS, "items": []})
+            digest["items"].append(item)
+        else:
+            _enqueue(item)
+        _start_worker()
+        _lock.notify()
+
+def notification_stats():
+    """Queue depth and delivery counters, with latency measured from send_ntfy to delivery"""
+    with _lock:
+        stats = dict(_stats)
+        stats["queued"] = len(_pending) + (1 if _busy else 0)
+        stats["in_digest"] = sum(len(d["items"]) for d in _digests.values())
+    stats["avg_latency"] = stats["total_latency"] / stats["sent"] if stats["sent"] else None
+    return stats
+
+def flush(timeout: float = 10):
+    """Wait up to `timeout` seconds for queued notifications to go out. Returns True if the queue drained"""
+    deadline = time.monotonic() + timeout
+    with _lock:
+        # Don't sit out the rest of any digest window
+        _release_digests(force=True)
+        _lock.notify_all()
+        while _pending or _busy:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            _lock.wait(remaining)
+    return True
+
+
+def set_transport(adapter: HTTPAdapter | None):
+    """Send notifications through a custom requests transport adapter, e.g. a stub for a local stand-in server. None restores the pooled default"""
+    global _session, _transport
+    with _lock:
+        _transport = adapter
+        if _session is not None:
+            _session.close()
+            _session = None
+
+def _get_session():
+    global _session
+    with _lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = _transport or HTTPAdapter(pool_connections=POOL_CONNECTIONS, pool_maxsize=POOL_MAXSIZE, pool_block=True)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            _session = session
+        return _session
+
+def _enqueue(item):
+    if len(_pending) >= QUEUE_SIZE:
+        _stats["dropped"] += 1
+        if OVERFLOW_POLICY == "drop_newest":
+            return
+        _pending.popleft()
+    _pending.append(item)
+
+def _release_digests(force=False):
+    now = time.monotonic()
+    for topic in [t for t, d in _digests.items() if force or d["due"] <= now]:
+        _enqueue(_combine(_digests.pop(topic)["items"]))
+
+def _combine(items):
+    if len(items) == 1:
+        return items[0]
+    titles = {title for _, _, title, _, _ in items}
+    shared_title = titles.pop() if len(titles) == 1 else None
+    title = f"{shared_title} ({len(items)})" if shared_title else f"{len(items)} updates"
+    # Keep each message's own title in the body unless they all share one
+    lines = [f"• {t}: {m}" if t and not shared_title else f"• {m}" for _, m, t, _, _ in items]
+    priority = max((p for *_, p in items), key=lambda p: PRIORITY_ORDER.index(p) if p in PRIORITY_ORDER else 2)
+    return (items[0][0], "\n".join(lines), title, items[0][3], priority)
+
+def _start_worker():
+    global _worker
+    if _worker is None or not _worker.is_alive():
+        _worker = threading.Thread(target=_run, name="ntfy-sender", daemon=True)
+        _worker.start()
+
+def _run():
+    global _busy
+    while True:
+        with _lock:
+            while True:
+                _release_digests()
+                if _pending:
+                    break
+                next_due = min((d["due"] for d in _digests.values()), default=None)
+                _lock.wait(None if next_due is None else max(next_due - time.monotonic(), 0))
+            item = _pending.popleft()
+            _busy = True
+        try:
+            _deliver(*item)
+        finally:
+            with _lock:
+                _busy = False
+                _lock.notify_all()
+
+def _deliver(queued_at, message, title, topic, priority):
+    headers = {}
+    if title:
+        headers["Title"] = title
+    if priority:
+        headers["Priority"] = priority
+
+    for attempt in range(MAX_ATTEMPTS):
+        if attempt:
+            with _lock:
+                _stats["retries"] += 1
+            time.sleep(BACKOFF_SECONDS * 2 ** (attempt - 1))
+        try:
+            resp = _get_session().post(f"{NTFY_SERVER}/{topic}", data=message.encode("utf-8"), headers=headers, timeout=REQUEST_TIMEOUT)
+        except Exception:
+            # Anything escaping here would kill the worker and lose the message uncounted
+            continue
+        # Rate limits and server errors are worth another go; other client errors are not
+        if resp.status_code == 429 or resp.status_code >= 500:
+            continue
+        if resp.status_code >= 400:
+            break
+        latency = time.monotonic() - queued_at
+        with _lock:
+            _stats["sent"] += 1
+            _stats["last_latency"] = latency
+            _stats["total_latency"] += latency
+        return
+    with _lock:
+        _stats["failed"] += 1
+
+def _shutdown():
+    # Give queued notifications a short window to go out when the server stops
+    flush(5)
+    if _session is not None:
+        _session.close()
+
+atexit.register(_shutdown)
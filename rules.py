@@ -0,0 +1,60 @@
+import threading
+import weakref
+
+ADMIN = "admin"
+PENDING_STATUSES = ["pending_add", "pending_remove"]
+
+_lock = threading.Lock()
+# Both memos hold one entry per live frame, so each household's cached frames keep their
+# own, and drop it when the frame is freed. Neither holds a strong reference to a frame
+_index = {}  # id(rules frame) -> (weakrefs to the approvals and users frames, index built from them)
+_directory = {}  # id(users frame) -> (every possible approver, proposer -> required approvers)
+
+
+def _memo(memo, frame, value):
+    # Caller holds _lock. The callback takes no lock: it can run from a collection inside one
+    if id(frame) not in memo:
+        weakref.finalize(frame, memo.pop, id(frame), None)
+    memo[id(frame)] = value
+
+
+def required_approvers(users, proposer):
+    """Everyone who has to approve `proposer`'s change: all users but the admin and the proposer.
+    load_users() hands out a new frame whenever user_data changes, which resets the memoized sets"""
+    with _lock:
+        if id(users) not in _directory:
+            _memo(_directory, users, (frozenset(users["username"]) - {ADMIN}, {}))
+        approvers, required = _directory[id(users)]
+        if proposer not in required:
+            required[proposer] = tuple(sorted(approvers - {proposer}))
+        return required[proposer]
+
+def approval_index(rules, approvals, users):
+    """Votes, required approvers and outstanding-approver counts for every pending rule, plus the
+    rules each user still has to vote on ("awaiting"). Built once per version of the three frames"""
+    with _lock:
+        if id(rules) in _index:
+            (approvals_ref, users_ref), index = _index[id(rules)]
+            if approvals_ref() is approvals and users_ref() is users:
+                return index
+    index = _build_index(rules, approvals, users)
+    with _lock:
+        _memo(_index, rules, ((weakref.ref(approvals), weakref.ref(users)), index))
+    return index
+
+def _build_index(rules, approvals, users):
+    pending = rules[rules["status"].isin(PENDING_STATUSES)]
+    votes = approvals[approvals["rule_id"].isin(pending["id"])]
+    voted = votes.groupby("rule_id")["approver"].agg(lambda s: set(s)).to_dict()
+
+    index = {"approvers": {}, "required": {}, "outstanding": {}, "awaiting": {}}
+    for rule_id, proposer in zip(pending["id"], pending["proposed_by"]):
+        required = required_approvers(users, proposer)
+        approvers = voted.get(rule_id, set())
+        missing = [u for u in required if u not in approvers]
+        index["approvers"][rule_id] = sorted(approvers)
+        index["required"][rule_id] = required
+        index["outstanding"][rule_id] = len(missing)
+        for user in missing:
+            index["awaiting"].setdefault(user, set()).add(rule_id)
+    return index
@@ -0,0 +1,1584 @@
+import atexit
+import contextlib
+import contextvars
+import datetime
+import glob
+import json
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+import pyarrow as pa
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+from cards import apply_card_delta, build_card_counters, counters_summary, same_counters
+from rules import PENDING_STATUSES, required_approvers
+
+# File paths, relative to the household's directory (see household_dir)
+ROOT = os.path.dirname(__file__)
+HOUSEHOLDS_DIR = os.path.join(ROOT, "households")
+USERS_PKL = "user_data.pkl"
+USERS_CSV = "user_data.csv"
+TICKETS_PKL = "tickets.pkl"
+TICKETS_CSV = "tickets.csv"
+TICKETS_LOG = "tickets_log.jsonl"
+TICKETS_AUDIT = "tickets_audit.jsonl"  # append-only; compaction never truncates it
+TICKETS_PARQUET = "tickets.parquet"
+TICKETS_ARROW = "tickets.{}.arrow"  # numbered snapshots; the highest number is current
+ARCHIVE_DIR = "archive"  # tickets-YYYY-MM.parquet, one per month received
+RULES_PKL = "rules.pkl"
+RULES_CSV = "rules.csv"
+RULES_PARQUET = "rules.parquet"
+APPROVALS_PKL = "rule_approvals.pkl"
+APPROVALS_CSV = "rule_approvals.csv"
+SQLITE_DB = "slacker_tracker.db"  # SLACKER_DB overrides the default household's database
+LOCK_FILE = "store.lock"
+VERSIONS_FILE = "store_versions.json"
+
+# "pickle" (tickets.pkl + event log), "parquet" (tickets.parquet + event log),
+# "arrow" (memory-mapped tickets.arrow + event log) or "sqlite"
+STORAGE_BACKEND = os.environ.get("SLACKER_STORAGE", "pickle").lower()
+
+USER_COLUMNS = ["username", "display_name", "password"]
+TICKET_COLUMNS = ["id", "receiver", "card_type", "date_received", "submitted_by", "status", "note"]
+# `approvals` is the old semicolon-joined voter list; it is only read to seed the approvals table
+RULE_COLUMNS = ["id", "text", "created_by", "status", "approvals", "proposed_by", "timestamp"]
+APPROVAL_COLUMNS = ["rule_id", "approver", "timestamp"]
+
+# Canonical in-memory ticket schema: low-cardinality text columns are categorical
+# and date_received is datetime64. Values outside the known sets are kept as
+# extra categories rather than dropped.
+CARD_TYPES = ["Yellow", "Red"]
+CARD_STATUSES = ["active", "expired", "converted"]
+TICKET_CATEGORIES = {"receiver": [], "card_type": CARD_TYPES, "status": CARD_STATUSES, "submitted_by": []}
+
+# Hot/cold tiering: cards in these states are moved out of the live tickets
+# table into the archive, which is only loaded for history and all-time stats
+TERMINAL_STATUSES = ["expired", "converted"]
+
+# Fold the event log back into the ticket snapshot once it grows past this many events
+LOG_COMPACT_EVENTS = 500
+# Ticket changes within this many seconds of the first are folded into one snapshot write
+FLUSH_DELAY_SECONDS = float(os.environ.get("SLACKER_FLUSH_SECONDS", "2"))
+# Rows per Parquet row group; query_tickets skips groups whose min/max stats rule them out
+PARQUET_ROW_GROUP_SIZE = 10_000
+
+
+# Households
+#
+# Each household is its own shard of the store: the default household keeps
+# its files (or database) in ROOT, any other one the same file names under
+# households/<name>/. Reads and writes go to the household chosen with
+# use_household() in the calling thread, and every household has its own
+# cache, lock and bookkeeping, so one app process can serve several houses.
+
+DEFAULT_HOUSEHOLD = "default"
+HOUSEHOLD_WORKERS = 8  # threads map_households() spreads the households over
+
+_household = contextvars.ContextVar("household", default=DEFAULT_HOUSEHOLD)
+_shards = {}
+_shards_lock = threading.Lock()
+
+def households():
+    """The default household, then every directory under households/ by name"""
+    try:
+        names = sorted(e.name for e in os.scandir(HOUSEHOLDS_DIR) if e.is_dir())
+    except OSError:
+        names = []
+    return [DEFAULT_HOUSEHOLD] + [n for n in names if n != DEFAULT_HOUSEHOLD]
+
+def use_household(name):
+    """Send this thread's storage calls to household `name`"""
+    if name not in households():
+        raise ValueError(f"Unknown household: {name}")
+    _household.set(name)
+
+def current_household():
+    return _household.get()
+
+def household_dir(name=None):
+    name = name or _household.get()
+    return ROOT if name == DEFAULT_HOUSEHOLD else os.path.join(HOUSEHOLDS_DIR, name)
+
+def map_households(fn, names=None):
+    """Call `fn()` inside each household (all of them by default) on a thread pool; returns {household: result}"""
+    names = list(names or households())
+
+    def run(name):
+        token = _household.set(name)
+        try:
+            return fn()
+        finally:
+            _household.reset(token)
+
+    with ThreadPoolExecutor(max_workers=max(1, min(len(names), HOUSEHOLD_WORKERS))) as pool:
+        return dict(zip(names, pool.map(run, names)))
+
+def _path(filename):
+    return os.path.join(household_dir(), filename)
+
+def _sqlite_db():
+    if _household.get() == DEFAULT_HOUSEHOLD:
+        return os.environ.get("SLACKER_DB", _path(SQLITE_DB))
+    return _path(SQLITE_DB)
+
+def _shard():
+    # The current household's cache and bookkeeping, created on first use
+    name = _household.get()
+    with _shards_lock:
+        if name not in _shards:
+            _shards[name] = {
+                # Guards the in-memory state below; held only briefly, never across file I/O
+                "lock": threading.RLock(),
+                # Serializes this process's writers; see _store_lock
+                "write_lock": threading.RLock(),
+                "cache": {},
+                "generation": {"users": 0, "tickets": 0, "live": 0, "archive": 0, "history": 0, "rules": 0, "approvals": 0},
+                # Source version right after this process last wrote each table
+                "written": {},
+                "expiry": {"changes": 1, "processed": 0, "next_due": None},
+                "counters": {"version": None, "counters": None},
+                "rule_index": (None, {}),  # (rules frame, id -> row position)
+                "store_lock": None,  # open LOCK_FILE while this process holds the write lock
+            }
+        return _shards[name]
+
+
+# Shared cache
+#
+# Streamlit re-executes the app script on every rerun, but imported modules live
+# as long as the server process. Frames cached here are therefore loaded once
+# and shared by every session until the files behind them change (checked by
+# mtime/size, or the version counter in SQLite mode) or this process writes
+# through save_*/append_ticket_events.
+# Callers must treat the returned frames as read-only and .copy() before editing.
+
+def _source_version(name):
+    if STORAGE_BACKEND == "sqlite":
+        # WAL checkpoints touch the database files on plain reads, so mtimes are no use here.
+        # Live and archived tickets are both written under the "tickets" version
+        return _sqlite_version("tickets" if name in ("live", "archive", "history") else name)
+    if name == "history":
+        # Live tickets plus every archive partition
+        return (_shard()["generation"]["tickets"], _source_version("tickets"), _archive_version())
+    if name == "live":
+        # The ticket files before finished cards are filtered out
+        return _source_version("tickets")
+    if name == "archive":
+        # Kept apart from the live files, so a live change doesn't reread every partition
+        return (_table_versions().get("archive", 0), _archive_version())
+    # The write counter catches rewrites that land within one mtime tick
+    counter = _table_versions().get(name, 0)
+    paths = {
+        "users": [_path(USERS_PKL), _path(USERS_CSV)],
+        "tickets": [_path(TICKETS_PKL), _path(TICKETS_CSV), _path(TICKETS_LOG)],
+        "rules": [_path(RULES_PKL), _path(RULES_CSV)],
+        "approvals": [_path(APPROVALS_PKL), _path(APPROVALS_CSV)],
+    }
+    if STORAGE_BACKEND == "parquet":
+        paths.update(tickets=[_path(TICKETS_PARQUET), _path(TICKETS_LOG)], rules=[_path(RULES_PARQUET)])
+    elif STORAGE_BACKEND == "arrow":
+        paths.update(tickets=[_arrow_current(), _path(TICKETS_LOG)])
+    paths = paths[name]
+    version = []
+    for path in paths:
+        try:
+            st = os.stat(path)
+            version.append((st.st_mtime_ns, st.st_size))
+        except OSError:
+            version.append(None)
+    return (counter, *version)
+
+def _cached(name, loader):
+    shard = _shard()
+    # Taken before loading, so a write that lands mid-load forces a reload next time
+    version = (shard["generation"][name], _source_version(name))
+    with shard["lock"]:
+        hit = shard["cache"].get(name)
+        if hit is not None and hit[0] == version:
+            return hit[1]
+        if name == "tickets" and version[1] != shard["written"].get(name):
+            # Someone else changed the tickets, so anything may be due now
+            shard["expiry"]["changes"] += 1
+    # Loaded outside the lock: other sessions keep reading their cache hits meanwhile
+    df = loader()
+    with shard["lock"]:
+        shard["cache"][name] = (version, df)
+    return df
+
+def _invalidate(name, expiry_changed=False):
+    shard = _shard()
+    with shard["lock"]:
+        if expiry_changed:
+            shard["expiry"]["changes"] += 1
+        shard["generation"][name] += 1
+        shard["cache"].pop(name, None)
+    written = _source_version(name)
+    with shard["lock"]:
+        shard["written"][name] = written
+
+def _archive_version():
+    try:
+        entries = [e for e in os.scandir(_path(ARCHIVE_DIR)) if e.name.endswith(".parquet")]
+    except OSError:
+        return ()
+    return tuple(sorted((e.name, e.stat().st_mtime_ns, e.stat().st_size) for e in entries))
+
+def clear_cache():
+    for name in _shard()["generation"]:
+        _invalidate(name)
+
+
+# Concurrent writers
+#
+# Sessions and server processes share a household's files, so every write
+# holds an exclusive lock on the household's LOCK_FILE and reads what it
+# changes inside the lock: each change is applied to the latest data, never to
+# a session's older copy. Writes then bump the table's counter in
+# VERSIONS_FILE (SQLite keeps its own version), which invalidates every
+# process's cache. save_tickets() and save_rules() replace a whole table, so
+# they can be given the table_version() the frame was loaded at and raise
+# WriteConflict instead of overwriting someone else's change.
+
+class WriteConflict(Exception):
+    """The table changed after the version a compare-and-swap save expected"""
+
+def table_version(name):
+    """Current version of "users", "tickets", "rules" or "approvals", for compare-and-swap saves"""
+    return _source_version(name)
+
+@contextlib.contextmanager
+def _store_lock():
+    # Re-entrant: only the outermost block takes the file lock. Only writers wait on it;
+    # readers take just the shard lock, and only around in-memory bookkeeping
+    shard = _shard()
+    with shard["write_lock"]:
+        if shard["store_lock"] is not None:
+            yield
+            return
+        f = open(_path(LOCK_FILE), "a+")
+        try:
+            _lock_file(f)
+            shard["store_lock"] = f
+            try:
+                yield
+            finally:
+                shard["store_lock"] = None
+                _unlock_file(f)
+        finally:
+            f.close()
+
+@contextlib.contextmanager
+def _writing(*names):
+    """Hold the write lock, and bump the counters of tables `names` once the write is done"""
+    with _store_lock():
+        try:
+            yield
+        finally:
+            if STORAGE_BACKEND != "sqlite":
+                _bump_table_versions(names)
+
+def _lock_file(f):
+    if fcntl is not None:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        return
+    f.seek(0)
+    while True:
+        try:
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+            return
+        except OSError:
+            time.sleep(0.05)
+
+def _unlock_file(f):
+    if fcntl is not None:
+        fcntl.flock(f, fcntl.LOCK_UN)
+    else:
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+def _table_versions():
+    try:
+        with open(_path(VERSIONS_FILE), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def _bump_table_versions(names):
+    versions = _table_versions()
+    for name in names:
+        versions[name] = versions.get(name, 0) + 1
+    # Only a cache hint: losing it in a crash means a reload, so it isn't worth an fsync
+    _atomic_write(_path(VERSIONS_FILE), lambda tmp: _write_json(versions, tmp), sync=False)
+
+def _write_json(obj, path):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(obj, f)
+
+def _atomic_write(path, write, sync=True):
+    """Call write(tmp) on a temporary file next to `path`, sync it (unless `sync` is false) and rename it
+    over `path`. Readers outside the lock, and a crash mid-write, only ever see the old or the new file"""
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        write(tmp)
+        if sync:
+            fd = os.open(tmp, os.O_RDONLY)
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+        os.replace(tmp, path)
+    except BaseException:
+        with contextlib.suppress(OSError):
+            os.remove(tmp)
+        raise
+
+
+# Write-behind
+#
+# A ticket change is durable once its line is appended to the event log, so
+# folding the log into a new snapshot and moving finished cards to the archive
+# is left to a background writer. A flush is only requested once the log
+# reaches LOG_COMPACT_EVENTS or a card is expired or converted, or after every
+# append in arrow mode, where replaying the log copies the mapped frame.
+# Requests within FLUSH_DELAY_SECONDS of the first are coalesced into one per
+# household, and flush_writes() (also run when the process exits) writes out
+# whatever is still pending. Until then, readers replay the log over the old
+# snapshot. SQLite commits its own writes.
+
+_flush_due = {}  # household -> monotonic deadline
+_flush_cond = threading.Condition()
+_flush_worker = None
+_flushing = False
+
+def flush_writes(timeout=10):
+    """Write out pending ticket snapshots now, waiting up to `timeout` seconds. Returns True if none are left"""
+    deadline = time.monotonic() + timeout
+    with _flush_cond:
+        for name in _flush_due:
+            _flush_due[name] = 0
+        if _flush_due:
+            _start_flush_worker()
+        _flush_cond.notify_all()
+        while _flush_due or _flushing:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            _flush_cond.wait(remaining)
+    return True
+
+def _finishes_card(events):
+    # Finished cards are what the flush moves to the archive
+    for event in events:
+        kind = event.get("event")
+        if kind == "card_issued":
+            status = event["data"].get("status")
+        elif kind == "status_changed":
+            status = event["status"]
+        elif kind == "card_updated":
+            status = event["changes"].get("status")
+        else:
+            continue
+        if status in TERMINAL_STATUSES:
+            return True
+    return False
+
+def _schedule_flush():
+    with _flush_cond:
+        _flush_due.setdefault(_household.get(), time.monotonic() + FLUSH_DELAY_SECONDS)
+        _start_flush_worker()
+        _flush_cond.notify()
+
+def _start_flush_worker():
+    global _flush_worker
+    if _flush_worker is None or not _flush_worker.is_alive():
+        _flush_worker = threading.Thread(target=_run_flusher, name="storage-flush", daemon=True)
+        _flush_worker.start()
+
+def _run_flusher():
+    global _flushing
+    while True:
+        with _flush_cond:
+            while True:
+                now = time.monotonic()
+                ready = [name for name, due in _flush_due.items() if due <= now]
+                if ready:
+                    break
+                next_due = min(_flush_due.values(), default=None)
+                _flush_cond.wait(None if next_due is None else max(next_due - now, 0))
+            name = ready[0]
+            del _flush_due[name]
+            _flushing = True
+        token = _household.set(name)
+        try:
+            _flush_tickets()
+        except Exception:
+            # The events are safe in the log; try again after another delay
+            with _flush_cond:
+                _flush_due.setdefault(name, time.monotonic() + FLUSH_DELAY_SECONDS)
+        finally:
+            _household.reset(token)
+            with _flush_cond:
+                _flushing = False
+                _flush_cond.notify_all()
+
+def _flush_tickets():
+    """Fold the event log into a fresh snapshot and move finished cards to the archive"""
+    with _store_lock():
+        counters = _shard()["counters"]
+        current = counters["version"] == _history_version()
+        # Re-read under the lock, so no event is appended between reading the log and removing it
+        df = _file_load_tickets()
+        terminal = df["status"].isin(TERMINAL_STATUSES)
+        if not os.path.exists(_path(TICKETS_LOG)) and not terminal.any():
+            return
+        with _writing("tickets"):
+            # Archive first: a crash in between leaves a card in both, and the live copy wins
+            _file_archive(df[terminal])
+            _file_save_tickets(df[~terminal].reset_index(drop=True))
+        _invalidate("tickets")
+        if current:
+            # Same cards in different files: the counters still hold
+            version = _history_version()
+            with _shard()["lock"]:
+                counters["version"] = version
+
+def _shutdown():
+    # Don't leave the last changes only in the log when the server stops
+    flush_writes(10)
+
+atexit.register(_shutdown)
+
+
+# Per-user counters
+#
+# Card totals, active counts and active yellow dates per user (see cards.py),
+# built from the full history once and then kept current by applying each
+# batch this process appends as a delta. save_tickets() or a change from
+# another process moves the history version on, which rebuilds them.
+
+def _history_version():
+    return (_shard()["generation"]["tickets"], _source_version("history"))
+
+def user_counters(usernames, today=None):
+    """Per-user totals, active counts, slacker score, expiring-soon count and next yellow expiry"""
+    shard = _shard()
+    counters = shard["counters"]
+    version = _history_version()
+    with shard["lock"]:
+        if counters["version"] == version:
+            return counters_summary(counters["counters"], usernames, today)
+    _rebuild_counters()
+    with shard["lock"]:
+        return counters_summary(counters["counters"], usernames, today)
+
+def verify_user_counters():
+    """Rebuild the counters from scratch and keep the rebuild. Returns whether the incremental ones matched it"""
+    shard = _shard()
+    with shard["write_lock"]:
+        user_counters([])
+        with shard["lock"]:
+            current = shard["counters"]["counters"]
+        return same_counters(current, _rebuild_counters(force=True))
+
+def _rebuild_counters(force=False):
+    # Under this process's write mutex (not the file lock), so no writer here applies a
+    # delta that the rebuild already counts; other processes' writes move the version on
+    shard = _shard()
+    counters = shard["counters"]
+    with shard["write_lock"]:
+        version = _history_version()
+        if force or counters["version"] != version:
+            fresh = build_card_counters(load_all_tickets())
+            with shard["lock"]:
+                counters.update(version=version, counters=fresh)
+        return counters["counters"]
+
+def _apply_counter_events(counters, history, events):
+    # Each event retracts the card as it stood and adds it back as it is now
+    ids = {e.get("id") for e in events}
+    cards = {r["id"]: r for r in history[history["id"].isin(ids)].to_dict("records")}
+    for e in events:
+        old = cards.pop(e.get("id"), None)
+        kind = e.get("event")
+        if kind == "card_issued":
+            new = {**(old or {}), **e["data"]}
+        elif kind == "status_changed":
+            new = old and {**old, "status": e["status"]}
+        elif kind == "card_updated":
+            new = old and {**old, **e["changes"]}
+        else:
+            new = None if kind == "card_deleted" else old
+        if old:
+            apply_card_delta(counters, old, -1)
+        if new:
+            apply_card_delta(counters, new, 1)
+            cards[e["id"]] = new
+
+
+# Expiry bookkeeping
+#
+# The app's expiry/conversion pass only has work to do once the oldest active
+# yellow reaches its expiry date, or after a change that could add an active
+# yellow. `changes` counts such changes; a pass records the count it started
+# from, so a yellow added while it runs still triggers the next one.
+
+def _may_add_active_yellow(event):
+    kind = event.get("event")
+    if kind == "card_issued":
+        return event["data"].get("card_type") == "Yellow" and event["data"].get("status") == "active"
+    if kind == "status_changed":
+        return event["status"] == "active"
+    return kind == "card_updated"
+
+def pending_expiry_pass(today):
+    """A stamp for finish_expiry_pass if the expiry/conversion pass needs to run, else None"""
+    shard = _shard()
+    with shard["lock"]:
+        expiry = shard["expiry"]
+        stamp = expiry["changes"]
+        due = expiry["next_due"]
+        if stamp != expiry["processed"] or (due is not None and today >= due):
+            return stamp
+        return None
+
+def run_expiry_pass(process):
+    """Run `process(tickets)` -> (processed, changed) over the latest live tickets while holding the
+    write lock, and append the events for whatever it changed. Two sessions or processes passing
+    at once then can't both act on the same cards. Returns the live tickets after the pass"""
+    with _store_lock():
+        tickets = load_tickets()
+        processed, changed = process(tickets)
+        if not changed:
+            return tickets
+        append_ticket_events(ticket_events(tickets, processed))
+        return processed
+
+def finish_expiry_pass(stamp, next_due):
+    """Record a completed pass; `next_due` is when the next yellow expires (None if there are none)"""
+    shard = _shard()
+    with shard["lock"]:
+        shard["expiry"]["processed"] = stamp
+        shard["expiry"]["next_due"] = next_due
+
+
+def load_users():
+    return _cached("users", _read_users)
+
+def _read_users():
+    if STORAGE_BACKEND == "sqlite":
+        return _sqlite_load_users()
+    return _pickle_load_users()
+
+def load_tickets():
+    """Live tickets: everything not yet expired or converted"""
+    return _cached("tickets", _read_tickets)
+
+def _read_tickets():
+    if STORAGE_BACKEND == "sqlite":
+        return _sqlite_load_tickets()
+    df = _cached("live", _file_load_tickets)
+    terminal = df["status"].isin(TERMINAL_STATUSES)
+    if terminal.any():
+        # Leave finished cards out now; the background writer moves them to the archive
+        _schedule_flush()
+        df = df[~terminal].reset_index(drop=True)
+    return df
+
+def load_all_tickets():
+    """Live and archived tickets together, live first, for history and all-time stats"""
+    return _cached("history", _read_history)
+
+def _read_history():
+    # Concatenating keeps the Arrow-backed string columns as chunks, so arrow mode still reads the mapping
+    if STORAGE_BACKEND == "sqlite":
+        return typed_tickets(pd.concat([load_tickets(), _cached("archive", _sqlite_load_archive)], ignore_index=True))
+    live = _cached("live", _file_load_tickets)
+    archive = _cached("archive", _file_load_archive)
+    # A finished card not flushed yet may already be in the archive too; the live copy is newer
+    archive = archive[~archive["id"].isin(live["id"])]
+    return typed_tickets(pd.concat([load_tickets(), live[live["status"].isin(TERMINAL_STATUSES)], archive], ignore_index=True))
+
+def typed_tickets(df):
+    """`df` with the canonical ticket dtypes applied to whichever ticket columns it has"""
+    df = df.copy(deep=False)
+    for column, known in TICKET_CATEGORIES.items():
+        if column not in df.columns:
+            continue
+        values = df[column]
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            # Already categorical: at most reorder the categories, leaving the codes' storage alone
+            present = list(values.cat.categories)
+            categories = known + sorted(set(present) - set(known))
+            if present != categories:
+                df[column] = values.cat.set_categories(categories)
+        else:
+            extra = sorted(set(values.dropna().unique()) - set(known))
+            df[column] = pd.Categorical(values, categories=known + extra)
+    if "date_received" in df.columns:
+        df["date_received"] = pd.to_datetime(df["date_received"])
+    return df
+
+def save_tickets(df, expected_version=None):
+    """Replace every ticket, live and archived. With `expected_version` (from table_version("tickets")),
+    raise WriteConflict rather than overwrite tickets changed since then"""
+    df = typed_tickets(df)
+    with _writing("tickets"):
+        if expected_version is not None and table_version("tickets") != expected_version:
+            raise WriteConflict("tickets changed since they were loaded")
+        if STORAGE_BACKEND == "sqlite":
+            _sqlite_save_tickets(df)
+        else:
+            # Every card goes into the snapshot first, which outranks the archive, so
+            # a crash before the last step can leave duplicates but never lose a card
+            _file_save_tickets(df)
+            terminal = df["status"].isin(TERMINAL_STATUSES)
+            _file_replace_archive(df[terminal])
+            _file_save_tickets(df[~terminal].reset_index(drop=True))
+    _invalidate("tickets", expiry_changed=True)
+
+def append_ticket_events(events, audit_by=None):
+    """Persist individual ticket changes without rewriting the table. Changes to archived
+    cards are applied to their archive partition; a card that leaves a terminal state moves back to the live table.
+    With `audit_by`, the events are also kept in the audit trail (see read_ticket_audit), attributed to that user"""
+    if not events:
+        return
+    # The lock stays held until the counters have caught up with this write
+    with _store_lock():
+        # Counters that are current now can take these events as a delta
+        counters = _shard()["counters"]
+        history = load_all_tickets() if counters["version"] == _history_version() else None
+        with _writing("tickets"):
+            if STORAGE_BACKEND == "sqlite":
+                _sqlite_apply_ticket_events(events, audit_by)
+            else:
+                _log_ticket_events(_file_apply_archive_events(events))
+                if audit_by is not None:
+                    _audit_ticket_events(events, audit_by)
+                # Arrow frames are only zero-copy with an empty log, so fold it back in soon after every append
+                if STORAGE_BACKEND == "arrow" or _finishes_card(events) or _log_length() >= LOG_COMPACT_EVENTS:
+                    _schedule_flush()
+        _invalidate("tickets", expiry_changed=any(_may_add_active_yellow(e) for e in events))
+        if history is not None:
+            version = _history_version()
+            with _shard()["lock"]:
+                _apply_counter_events(counters["counters"], history, events)
+                counters["version"] = version
+
+def query_tickets(receiver=None, card_type=None, status=None, start=None, end=None, columns=None):
+    """Tickets matching every given filter, newest first (ties by id). `start`/`end` bound date_received
+    inclusively. The SQLite and Parquet backends only read the matching rows and the requested `columns`"""
+    if STORAGE_BACKEND == "sqlite":
+        return _sqlite_query_tickets(receiver, card_type, status, start, end, columns)
+    if STORAGE_BACKEND == "parquet" and not os.path.exists(_path(TICKETS_LOG)):
+        return _parquet_query_tickets(receiver, card_type, status, start, end, columns)
+    df = load_all_tickets()
+    mask = pd.Series(True, index=df.index)
+    if receiver is not None:
+        mask &= df["receiver"] == receiver
+    if card_type is not None:
+        mask &= df["card_type"] == card_type
+    if status is not None:
+        mask &= df["status"] == status
+    if start is not None:
+        mask &= df["date_received"] >= pd.Timestamp(start)
+    if end is not None:
+        mask &= df["date_received"] <= pd.Timestamp(end)
+    df = _newest_first(df[mask])
+    return df[columns] if columns is not None else df
+
+def _newest_first(df):
+    # The order every backend returns query_tickets results in
+    return df.sort_values(["date_received", "id"], ascending=[False, True], kind="stable",
+                          na_position="last").reset_index(drop=True)
+
+def load_rules():
+    return _cached("rules", _read_rules)
+
+def _read_rules():
+    if STORAGE_BACKEND == "sqlite":
+        return _sqlite_load_rules()
+    if STORAGE_BACKEND == "parquet":
+        return _parquet_load_rules()
+    return _pickle_load_rules()
+
+def save_rules(df, expected_version=None):
+    """Replace the rules table. With `expected_version` (from table_version("rules")),
+    raise WriteConflict rather than overwrite rules changed since then"""
+    with _writing("rules"):
+        if expected_version is not None and table_version("rules") != expected_version:
+            raise WriteConflict("rules changed since they were loaded")
+        if STORAGE_BACKEND == "sqlite":
+            _sqlite_save_rules(df)
+        else:
+            _file_save_rules(df)
+    _invalidate("rules")
+
+def add_rule(rule):
+    """Insert one rule at the top of the table"""
+    with _writing("rules"):
+        if STORAGE_BACKEND == "sqlite":
+            _sqlite_add_rule(rule)
+        else:
+            _file_save_rules(pd.concat([pd.DataFrame([rule]), load_rules()], ignore_index=True))
+    _invalidate("rules")
+
+def update_rule(rule_id, **fields):
+    """Set several fields of one rule, persisted as a single write"""
+    update_rules([rule_id], **fields)
+
+def update_rules(rule_ids, **fields):
+    """Set the same fields on every rule in `rule_ids`, persisted as a single write"""
+    if not fields:
+        return
+    with _writing("rules"):
+        if STORAGE_BACKEND == "sqlite":
+            _sqlite_update_rules(rule_ids, fields)
+        else:
+            df = load_rules()
+            index = _rule_positions(df)
+            positions = [index[r] for r in rule_ids if r in index]
+            if not positions:
+                return
+            df = df.copy()
+            df.iloc[positions, [df.columns.get_loc(c) for c in fields]] = list(fields.values())
+            _file_save_rules(df)
+    _invalidate("rules")
+
+def delete_rules(rule_ids):
+    """Remove rules by id"""
+    rule_ids = list(rule_ids)
+    if not rule_ids:
+        return
+    with _writing("rules"):
+        if STORAGE_BACKEND == "sqlite":
+            _sqlite_delete_rules(rule_ids)
+        else:
+            df = load_rules()
+            _file_save_rules(df[~df["id"].isin(rule_ids)].reset_index(drop=True))
+    _invalidate("rules")
+
+def _rule_positions(df):
+    # Built once per cached rules frame, so lookups by id don't scan the table
+    shard = _shard()
+    with shard["lock"]:
+        if shard["rule_index"][0] is not df:
+            shard["rule_index"] = (df, {rule_id: pos for pos, rule_id in enumerate(df["id"])})
+        return shard["rule_index"][1]
+
+def load_approvals():
+    """One row per vote on a pending rule: (rule_id, approver, timestamp)"""
+    return _cached("approvals", _read_approvals)
+
+def _read_approvals():
+    if STORAGE_BACKEND == "sqlite":
+        return _sqlite_load_approvals()
+    return _pickle_load_approvals()
+
+def add_approval(rule_id, approver):
+    """Record `approver`'s vote on a pending rule; voting twice is a no-op. Returns how many required
+    approvers still have to vote, counted under the write lock so exactly one caller sees 0,
+    or None if the rule is no longer pending"""
+    timestamp = datetime.datetime.utcnow().isoformat()
+    with _writing("approvals"):
+        rules = load_rules()
+        rule = rules[rules["id"] == rule_id]
+        if rule.empty or rule["status"].iloc[0] not in PENDING_STATUSES:
+            return None
+        if STORAGE_BACKEND == "sqlite":
+            _sqlite_add_approval(rule_id, approver, timestamp)
+            df = _sqlite_load_approvals()
+        else:
+            df = load_approvals()
+            if not ((df["rule_id"] == rule_id) & (df["approver"] == approver)).any():
+                row = pd.DataFrame([{"rule_id": rule_id, "approver": approver, "timestamp": timestamp}])
+                df = pd.concat([df, row], ignore_index=True)
+                _pickle_save_approvals(df)
+        voters = set(df.loc[df["rule_id"] == rule_id, "approver"])
+        required = required_approvers(load_users(), rule["proposed_by"].iloc[0])
+    _invalidate("approvals")
+    return sum(user not in voters for user in required)
+
+def clear_approvals(rule_ids):
+    """Drop every vote on the given rules, e.g. once they are decided or deleted"""
+    rule_ids = list(rule_ids)
+    if not rule_ids:
+        return
+    with _writing("approvals"):
+        if STORAGE_BACKEND == "sqlite":
+            _sqlite_clear_approvals(rule_ids)
+        else:
+            df = load_approvals()
+            _pickle_save_approvals(df[~df["rule_id"].isin(rule_ids)].reset_index(drop=True))
+    _invalidate("approvals")
+
+
+# Pickle backend
+#
+# Users and approvals stay in pickles in Parquet mode too, and the pickle/CSV
+# files are what the Parquet and SQLite backends migrate from.
+
+def _pickle_load_users():
+    if os.path.exists(_path(USERS_PKL)):
+        try:
+            return pd.read_pickle(_path(USERS_PKL))
+        except Exception:
+            pass
+    if os.path.exists(_path(USERS_CSV)):
+        df = pd.read_csv(_path(USERS_CSV))
+        try:
+            _atomic_write(_path(USERS_PKL), df.to_pickle)
+        except Exception:
+            pass
+        return df
+    return pd.DataFrame(columns=USER_COLUMNS)
+
+def _pickle_load_ticket_snapshot():
+    if os.path.exists(_path(TICKETS_PKL)):
+        try:
+            return pd.read_pickle(_path(TICKETS_PKL))
+        except Exception:
+            pass
+    if os.path.exists(_path(TICKETS_CSV)):
+        df = pd.read_csv(_path(TICKETS_CSV), parse_dates=["date_received"]) if os.path.getsize(_path(TICKETS_CSV)) > 0 else pd.DataFrame(
+            columns=TICKET_COLUMNS
+        )
+        try:
+            _atomic_write(_path(TICKETS_PKL), df.to_pickle)
+        except Exception:
+            pass
+        return df
+    return pd.DataFrame(columns=TICKET_COLUMNS)
+
+def _file_load_tickets():
+    """Load the ticket snapshot (pickle, Parquet or Arrow) and replay any events logged since it was written"""
+    if STORAGE_BACKEND == "arrow":
+        return _arrow_load_tickets()
+    df = _parquet_load_ticket_snapshot() if STORAGE_BACKEND == "parquet" else _pickle_load_ticket_snapshot()
+    return _replay_ticket_log(df)
+
+def _replay_ticket_log(df):
+    events = read_ticket_events()
+    if len(events) >= LOG_COMPACT_EVENTS:
+        # Left behind by a process that stopped before flushing
+        _schedule_flush()
+    return typed_tickets(replay_ticket_events(df, events) if events else df)
+
+def _file_save_tickets(df):
+    """Write a full snapshot of the tickets table and start a fresh event log"""
+    if STORAGE_BACKEND == "parquet":
+        _parquet_write(df, _path(TICKETS_PARQUET))
+    elif STORAGE_BACKEND == "arrow":
+        _arrow_write(df)
+    else:
+        _atomic_write(_path(TICKETS_PKL), df.to_pickle)
+    if os.path.exists(_path(TICKETS_LOG)):
+        os.remove(_path(TICKETS_LOG))
+
+def _pickle_load_rules():
+    if os.path.exists(_path(RULES_PKL)):
+        try:
+            df = pd.read_pickle(_path(RULES_PKL))
+            return df
+        except Exception:
+            pass
+    if os.path.exists(_path(RULES_CSV)):
+        df = pd.read_csv(_path(RULES_CSV)) if os.path.getsize(_path(RULES_CSV)) > 0 else pd.DataFrame(
+            columns=RULE_COLUMNS
+        )
+        try:
+            _atomic_write(_path(RULES_PKL), df.to_pickle)
+        except Exception:
+            pass
+        return df
+    return pd.DataFrame(columns=RULE_COLUMNS)
+
+def _pickle_save_rules(df):
+    _atomic_write(_path(RULES_PKL), df.to_pickle)
+
+def _file_save_rules(df):
+    if STORAGE_BACKEND == "parquet":
+        _parquet_write(df, _path(RULES_PARQUET))
+    else:
+        _pickle_save_rules(df)
+
+def _legacy_approvals(rules):
+    # Split the old "alice;bob" approvals strings into one row per vote
+    if "approvals" not in rules.columns:
+        return pd.DataFrame(columns=APPROVAL_COLUMNS)
+    votes = pd.DataFrame({
+        "rule_id": rules["id"],
+        "approver": rules["approvals"].fillna("").astype(str).str.split(";"),
+        "timestamp": None,
+    }).explode("approver")
+    votes["approver"] = votes["approver"].str.strip()
+    votes = votes[votes["approver"].fillna("") != ""]
+    return votes.drop_duplicates(["rule_id", "approver"]).reset_index(drop=True)[APPROVAL_COLUMNS]
+
+def _pickle_load_approvals():
+    if os.path.exists(_path(APPROVALS_PKL)):
+        try:
+            return pd.read_pickle(_path(APPROVALS_PKL))
+        except Exception:
+            pass
+    if os.path.exists(_path(APPROVALS_CSV)):
+        if os.path.getsize(_path(APPROVALS_CSV)) > 0:
+            return pd.read_csv(_path(APPROVALS_CSV))
+        return pd.DataFrame(columns=APPROVAL_COLUMNS)
+    # First run: seed from the votes stored on the rules themselves
+    return _legacy_approvals(_parquet_load_rules() if STORAGE_BACKEND == "parquet" else _pickle_load_rules())
+
+def _pickle_save_approvals(df):
+    _atomic_write(_path(APPROVALS_PKL), df.to_pickle)
+
+
+# Archive
+#
+# Expired and converted cards from the file backends live in one Parquet file
+# per month received. Partitions are rewritten whole, which is fine because a
+# card normally lands there once and is rarely touched again. The loaded
+# archive is cached on its own, so live changes don't reread the partitions.
+
+def _archive_months(df):
+    return df["date_received"].dt.strftime("%Y-%m").fillna("undated")
+
+def _archive_path(month):
+    return os.path.join(_path(ARCHIVE_DIR), f"tickets-{month}.parquet")
+
+def _file_load_archive():
+    # Newest month first, to match the live table's newest-first order
+    paths = sorted(glob.glob(os.path.join(_path(ARCHIVE_DIR), "tickets-*.parquet")), reverse=True)
+    frames = _read_partitions(paths)
+    if not frames:
+        return typed_tickets(pd.DataFrame(columns=TICKET_COLUMNS))
+    return typed_tickets(pd.concat(frames, ignore_index=True))
+
+def _file_archive(cards):
+    """Merge `cards` into their monthly partitions, replacing any older copy of the same card"""
+    if cards.empty:
+        return
+    os.makedirs(_path(ARCHIVE_DIR), exist_ok=True)
+    for month, rows in cards.groupby(_archive_months(cards), sort=False):
+        path = _archive_path(month)
+        if os.path.exists(path):
+            old = pd.read_parquet(path)
+            rows = pd.concat([rows, old[~old["id"].isin(rows["id"])]], ignore_index=True)
+        _parquet_write(typed_tickets(rows).reset_index(drop=True), path)
+    _bump_table_versions(["archive"])
+
+def _file_replace_archive(cards):
+    """Make the archive hold exactly `cards`: write each month's partition, then remove the months left over"""
+    os.makedirs(_path(ARCHIVE_DIR), exist_ok=True)
+    written = set()
+    for month, rows in cards.groupby(_archive_months(cards), sort=False):
+        written.add(_archive_path(month))
+        _parquet_write(typed_tickets(rows).reset_index(drop=True), _archive_path(month))
+    for path in glob.glob(os.path.join(_path(ARCHIVE_DIR), "tickets-*.parquet")):
+        if path not in written:
+            os.remove(path)
+    _bump_table_versions(["archive"])
+
+def _file_unarchive(cards):
+    """Drop `cards` from the partitions they are stored in"""
+    for month, rows in cards.groupby(_archive_months(cards), sort=False):
+        path = _archive_path(month)
+        if not os.path.exists(path):
+            continue
+        old = pd.read_parquet(path)
+        kept = old[~old["id"].isin(rows["id"])]
+        if kept.empty:
+            os.remove(path)
+        else:
+            _parquet_write(kept.reset_index(drop=True), path)
+    _bump_table_versions(["archive"])
+
+def _file_apply_archive_events(events):
+    """Apply the events that touch archived cards to the archive, returning the events
+    still to be logged against the live table, plus card_issued for any card revived"""
+    live_ids = set(_cached("live", _file_load_tickets)["id"])
+    cold_ids = {e["id"] for e in events if e.get("event") != "card_issued" and e["id"] not in live_ids}
+    if not cold_ids:
+        return events
+    archive = _cached("archive", _file_load_archive)
+    stored = archive[archive["id"].isin(cold_ids)]
+    if stored.empty:
+        return events
+    archived_ids = set(stored["id"])
+    updated = typed_tickets(replay_ticket_events(stored, [e for e in events if e["id"] in archived_ids]))
+    # Remove first: an edit may have moved a card to another month's partition
+    _file_unarchive(stored)
+    terminal = updated["status"].isin(TERMINAL_STATUSES)
+    _file_archive(updated[terminal])
+    revived = [card_issued_event(r) for r in updated[~terminal].to_dict("records")]
+    return [e for e in events if e["id"] not in archived_ids] + revived
+
+
+# Parquet backend
+#
+# Same event log as the pickle backend, but snapshots are written as Parquet so
+# query_tickets can read only the columns and row groups it needs. On first use
+# the Parquet files are created from the pickle/CSV files, which are left in place.
+
+def _parquet_write(df, path):
+    _atomic_write(path, lambda tmp: df.to_parquet(tmp, index=False, row_group_size=PARQUET_ROW_GROUP_SIZE))
+
+def _read_partitions(paths, **kwargs):
+    # A partition can be removed by a writer between listing and reading it; the version bump reloads
+    frames = []
+    for path in paths:
+        try:
+            frames.append(pd.read_parquet(path, **kwargs))
+        except FileNotFoundError:
+            pass
+    return frames
+
+def _parquet_load_ticket_snapshot():
+    if not os.path.exists(_path(TICKETS_PARQUET)):
+        with _writing("tickets"):
+            if not os.path.exists(_path(TICKETS_PARQUET)):
+                _parquet_write(typed_tickets(_pickle_load_ticket_snapshot()), _path(TICKETS_PARQUET))
+    return pd.read_parquet(_path(TICKETS_PARQUET))
+
+def _parquet_query_tickets(receiver, card_type, status, start, end, columns):
+    if not os.path.exists(_path(TICKETS_PARQUET)):
+        _parquet_load_ticket_snapshot()
+    filters = [(col, "==", value) for col, value in (("receiver", receiver), ("card_type", card_type), ("status", status)) if value is not None]
+    if start is not None:
+        filters.append(("date_received", ">=", pd.Timestamp(start)))
+    if end is not None:
+        filters.append(("date_received", "<=", pd.Timestamp(end)))
+    cols = [c for c in (columns or TICKET_COLUMNS) if c in TICKET_COLUMNS]
+    # The sort and de-duplication keys are read even when they weren't asked for
+    read = cols + [c for c in ("id", "date_received") if c not in cols]
+    paths = [_path(TICKETS_PARQUET)] + sorted(glob.glob(os.path.join(_path(ARCHIVE_DIR), "tickets-*.parquet")), reverse=True)
+    frames = _read_partitions(paths, columns=read, filters=filters or None)
+    df = typed_tickets(pd.concat(frames, ignore_index=True))
+    # Mid-flush a finished card can be in the snapshot and its partition at once
+    return _newest_first(df.drop_duplicates("id"))[cols]
+
+def _parquet_load_rules():
+    if not os.path.exists(_path(RULES_PARQUET)):
+        with _writing("rules"):
+            if not os.path.exists(_path(RULES_PARQUET)):
+                _parquet_write(_pickle_load_rules(), _path(RULES_PARQUET))
+    return pd.read_parquet(_path(RULES_PARQUET))
+
+
+# Arrow backend
+#
+# Snapshots are uncompressed Arrow IPC files that every session and process
+# memory-maps read-only: string columns stay Arrow-backed and point straight into
+# the shared page cache, so resident memory doesn't grow with each process. Until
+# the background writer folds logged events into a new snapshot they are replayed
+# over the mapped one. Rules, users and approvals stay in pickles.
+#
+# Each snapshot is a new numbered file rather than a rename over the old one,
+# which Windows refuses while any process still maps it. Older snapshots are
+# removed once nothing maps them, retried on every write until then.
+
+def _arrow_number(path):
+    number = os.path.basename(path).split(".")[1]
+    return int(number) if number.isdigit() else None
+
+def _arrow_snapshots():
+    # Every snapshot on disk, oldest first
+    paths = [path for path in glob.glob(_path(TICKETS_ARROW.format("*"))) if _arrow_number(path) is not None]
+    return sorted(paths, key=_arrow_number)
+
+def _arrow_current():
+    # The newest snapshot, or the path the first one will get
+    snapshots = _arrow_snapshots()
+    return snapshots[-1] if snapshots else _path(TICKETS_ARROW.format(1))
+
+def _arrow_write(df):
+    snapshots = _arrow_snapshots()
+    number = _arrow_number(snapshots[-1]) + 1 if snapshots else 1
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    def write(tmp):
+        with pa.OSFile(tmp, "wb") as sink, pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    _atomic_write(_path(TICKETS_ARROW.format(number)), write)
+    for old in snapshots:
+        try:
+            os.remove(old)
+        except OSError:
+            pass  # still mapped somewhere (Windows); a later write removes it
+
+def _arrow_map(path):
+    # split_blocks keeps pandas from consolidating columns into freshly allocated blocks
+    return pa.ipc.open_file(pa.memory_map(path)).read_all().to_pandas(split_blocks=True)
+
+def _arrow_load_tickets():
+    if not _arrow_snapshots():
+        with _writing("tickets"):
+            if not _arrow_snapshots():
+                _arrow_write(typed_tickets(_pickle_load_ticket_snapshot()))
+    while True:
+        path = _arrow_current()
+        try:
+            snapshot = _arrow_map(path)
+            break
+        except FileNotFoundError:
+            # Superseded and removed between finding it and mapping it
+            if _arrow_current() == path:
+                raise
+    return _replay_ticket_log(snapshot)
+
+
+# Ticket event log
+#
+# Each line of TICKETS_LOG is one JSON event:
+#   {"event": "card_issued", "id": ..., "at": ..., "data": {<full ticket row>}}
+#   {"event": "status_changed", "id": ..., "at": ..., "status": "expired"}
+#   {"event": "card_updated", "id": ..., "at": ..., "changes": {<column>: <value>}}
+#   {"event": "card_deleted", "id": ..., "at": ...}
+# Replaying is idempotent, so a crash between writing a snapshot and clearing
+# the log only means some events are applied twice.
+#
+# Audited changes (admin edits) are also appended to TICKETS_AUDIT, or the
+# ticket_audit table in SQLite mode, as the same events plus a "by" field.
+# That record is kept for good: flushes and compaction only clear the log.
+
+def _clean_value(value):
+    if value is None or (not isinstance(value, (list, dict)) and pd.isna(value)):
+        return None
+    if isinstance(value, (pd.Timestamp, datetime.date)):
+        return value.strftime("%Y-%m-%d")
+    if hasattr(value, "item"):
+        return value.item()
+    return value
+
+def _ticket_record(row):
+    return {k: _clean_value(v) for k, v in dict(row).items()}
+
+def _event(kind, ticket_id, **fields):
+    return {"event": kind, "id": ticket_id, "at": datetime.datetime.utcnow().isoformat(), **fields}
+
+def card_issued_event(ticket):
+    record = _ticket_record(ticket)
+    return _event("card_issued", record["id"], data=record)
+
+def status_changed_event(ticket_id, status, before=None):
+    event = _event("status_changed", ticket_id, status=status)
+    if before is not None:
+        event["before"] = {"status": _clean_value(before)}
+    return event
+
+def card_updated_event(ticket_id, changes, before=None):
+    event = _event("card_updated", ticket_id, changes={k: _clean_value(v) for k, v in changes.items()})
+    if before is not None:
+        event["before"] = {k: _clean_value(v) for k, v in before.items()}
+    return event
+
+def card_deleted_event(ticket_id):
+    return _event("card_deleted", ticket_id)
+
+def _comparable(df):
+    # Dates compare as their stored YYYY-MM-DD text, whatever dtype the editor handed back
+    out = df.astype(object)
+    if "date_received" in out.columns:
+        out["date_received"] = pd.to_datetime(df["date_received"], errors="coerce").dt.strftime("%Y-%m-%d").astype(object)
+    return out
+
+def ticket_events(old, new):
+    """Events that turn the `old` tickets frame into `new`; only rows that differ produce an event, and updates record the values they replace"""
+    old_ids = old["id"]
+    new_ids = new["id"]
+
+    events = []
+    # New tickets sit at the top of the table, so issue them bottom-up to replay in the same order
+    for record in reversed(new[~new_ids.isin(old_ids)].to_dict("records")):
+        events.append(card_issued_event(record))
+
+    columns = [c for c in new.columns if c in old.columns and c != "id"]
+    after = _comparable(new.loc[new_ids.isin(old_ids)].set_index("id")[columns])
+    before = _comparable(old.set_index("id")[columns]).reindex(after.index)
+    differs = (before != after) & ~(before.isna() & after.isna())
+    for ticket_id, row in differs[differs.any(axis=1)].iterrows():
+        changed = list(row.index[row.to_numpy()])
+        if changed == ["status"]:
+            events.append(status_changed_event(ticket_id, after.at[ticket_id, "status"], before=before.at[ticket_id, "status"]))
+        else:
+            events.append(card_updated_event(
+                ticket_id,
+                {c: after.at[ticket_id, c] for c in changed},
+                before={c: before.at[ticket_id, c] for c in changed},
+            ))
+
+    for ticket_id in old_ids[~old_ids.isin(new_ids)]:
+        events.append(card_deleted_event(ticket_id))
+    return events
+
+def _log_ticket_events(events):
+    # Synced before returning: the log line is what makes a change durable
+    lines = "".join(json.dumps(e) + "\n" for e in events)
+    with open(_path(TICKETS_LOG), "a", encoding="utf-8") as f:
+        f.write(lines)
+        f.flush()
+        os.fsync(f.fileno())
+
+def _log_length():
+    try:
+        with open(_path(TICKETS_LOG), "rb") as f:
+            return sum(chunk.count(b"\n") for chunk in iter(lambda: f.read(1 << 16), b""))
+    except OSError:
+        return 0
+
+def _audit_ticket_events(events, by):
+    lines = "".join(json.dumps({**e, "by": by}) + "\n" for e in events)
+    with open(_path(TICKETS_AUDIT), "a", encoding="utf-8") as f:
+        f.write(lines)
+        f.flush()
+        os.fsync(f.fileno())
+
+def read_ticket_audit(limit=None):
+    """Every audited ticket event, oldest first: the logged event plus "by", the user who made it.
+    With `limit`, only the last `limit` events, read from the end of the trail"""
+    if STORAGE_BACKEND == "sqlite":
+        if limit is None:
+            return [json.loads(row) for row in _sqlite_read("SELECT event FROM ticket_audit ORDER BY seq")["event"]]
+        sql = "SELECT event FROM (SELECT seq, event FROM ticket_audit ORDER BY seq DESC LIMIT ?) ORDER BY seq"
+        return [json.loads(row) for row in _sqlite_read(sql, [limit])["event"]]
+    if not os.path.exists(_path(TICKETS_AUDIT)):
+        return []
+    if limit is None:
+        with open(_path(TICKETS_AUDIT), encoding="utf-8") as f:
+            lines = [line.strip() for line in f]
+    else:
+        lines = _tail_lines(_path(TICKETS_AUDIT), limit)
+    events = []
+    for line in lines:
+        if not line:
+            continue
+        try:
+            events.append(json.loads(line))
+        except ValueError:
+            break
+    return events
+
+def _tail_lines(path, count, block=1 << 16):
+    # The last `count` non-empty lines of `path`, reading backwards a block at a time
+    if count <= 0:
+        return []
+    with open(path, "rb") as f:
+        end = f.seek(0, os.SEEK_END)
+        data = b""
+        while True:
+            start = max(0, end - block)
+            f.seek(start)
+            data = f.read(end - start) + data
+            end = start
+            # Until the start of the file, the first piece may be the tail of an earlier line
+            lines = data.split(b"\n")[1 if end else 0:]
+            lines = [line.strip() for line in lines if line.strip()]
+            if end == 0 or len(lines) >= count:
+                return [line.decode("utf-8") for line in lines[-count:]]
+
+def read_ticket_events():
+    if not os.path.exists(_path(TICKETS_LOG)):
+        return []
+    events = []
+    with open(_path(TICKETS_LOG), encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                events.append(json.loads(line))
+            except ValueError:
+                # A torn final line from an interrupted append; everything before it is intact
+                break
+    return events
+
+def replay_ticket_events(df, events):
+    records = {r["id"]: r for r in df.to_dict("records")}
+    issued = []
+    for e in events:
+        ticket_id = e.get("id")
+        kind = e.get("event")
+        if kind == "card_issued":
+            if ticket_id in records:
+                records[ticket_id].update(e["data"])
+            else:
+                records[ticket_id] = dict(e["data"])
+                issued.append(ticket_id)
+        elif kind == "status_changed":
+            if ticket_id in records:
+                records[ticket_id]["status"] = e["status"]
+        elif kind == "card_updated":
+            if ticket_id in records:
+                records[ticket_id].update(e["changes"])
+        elif kind == "card_deleted":
+            records.pop(ticket_id, None)
+
+    # Newly issued tickets go on top, newest first, like the app inserts them
+    new_ids = [t for t in dict.fromkeys(reversed(issued)) if t in records]
+    new_set = set(new_ids)
+    order = new_ids + [t for t in records if t not in new_set]
+    columns = list(df.columns) if len(df.columns) else list(TICKET_COLUMNS)
+    return pd.DataFrame([records[t] for t in order], columns=columns)
+
+
+# SQLite backend
+#
+# One row per ticket/rule/user. Rows are returned newest first (rowid DESC) so
+# frames come back in the same order the pickle backend keeps them.
+
+_TICKET_INDEXES = ["receiver", "status", "card_type", "date_received"]
+
+def _connect():
+    conn = sqlite3.connect(_sqlite_db(), timeout=10)
+    conn.execute("PRAGMA journal_mode=WAL")
+    tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    if not {"meta", "tickets", "rule_approvals", "tickets_archive", "ticket_audit"} <= tables:
+        # First run or an older database: set up under the write lock so only one process seeds it
+        with _store_lock():
+            _sqlite_setup(conn)
+    return conn
+
+def _sqlite_setup(conn):
+    conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER)")
+    is_new = conn.execute("SELECT name FROM sqlite_master WHERE name = 'tickets'").fetchone() is None
+    if is_new:
+        with conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS users (username TEXT PRIMARY KEY, display_name TEXT, password TEXT)")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS tickets (id TEXT PRIMARY KEY, receiver TEXT, card_type TEXT, "
+                "date_received TEXT, submitted_by TEXT, status TEXT, note TEXT)"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS rules (id TEXT PRIMARY KEY, text TEXT, created_by TEXT, status TEXT, "
+                "approvals TEXT, proposed_by TEXT, timestamp TEXT)"
+            )
+            for col in _TICKET_INDEXES:
+                conn.execute(f"CREATE INDEX IF NOT EXISTS idx_tickets_{col} ON tickets ({col})")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_rules_status ON rules (status)")
+            # First run: bring over whatever the pickle/CSV files and archive hold
+            _sqlite_replace(conn, "users", _pickle_load_users(), USER_COLUMNS)
+            tickets = pd.concat([_file_load_tickets(), _file_load_archive()], ignore_index=True)
+            _sqlite_replace(conn, "tickets", tickets.drop_duplicates("id"), TICKET_COLUMNS)
+            _sqlite_replace(conn, "rules", _pickle_load_rules(), RULE_COLUMNS)
+    if conn.execute("SELECT name FROM sqlite_master WHERE name = 'rule_approvals'").fetchone() is None:
+        with conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS rule_approvals (rule_id TEXT, approver TEXT, timestamp TEXT, "
+                "PRIMARY KEY (rule_id, approver))"
+            )
+            if is_new:
+                votes = _pickle_load_approvals()
+            else:
+                votes = _legacy_approvals(pd.read_sql_query("SELECT id, approvals FROM rules", conn))
+            _sqlite_replace(conn, "rule_approvals", votes, APPROVAL_COLUMNS)
+    if conn.execute("SELECT name FROM sqlite_master WHERE name = 'tickets_archive'").fetchone() is None:
+        with conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS tickets_archive (id TEXT PRIMARY KEY, receiver TEXT, card_type TEXT, "
+                "date_received TEXT, submitted_by TEXT, status TEXT, note TEXT)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_tickets_archive_date_received ON tickets_archive (date_received)")
+            _sqlite_tier(conn)
+            _sqlite_bump_version(conn, "tickets")
+    with conn:
+        conn.execute("CREATE TABLE IF NOT EXISTS ticket_audit (seq INTEGER PRIMARY KEY AUTOINCREMENT, event TEXT)")
+
+def _sqlite_bump_version(conn, *names):
+    # One row per table ("version:tickets", ...), so a vote doesn't invalidate the cached tickets
+    conn.executemany(
+        "INSERT INTO meta (key, value) VALUES (?, 1) ON CONFLICT(key) DO UPDATE SET value = value + 1",
+        [(f"version:{name}",) for name in names],
+    )
+
+def _sqlite_version(name):
+    conn = _connect()
+    try:
+        row = conn.execute("SELECT value FROM meta WHERE key = ?", (f"version:{name}",)).fetchone()
+    finally:
+        conn.close()
+    return row[0] if row else 0
+
+_SQLITE_TABLE_VERSIONS = {"users": "users", "tickets": "tickets", "rules": "rules", "rule_approvals": "approvals"}
+
+def _sqlite_replace(conn, table, df, columns):
+    # Insert bottom-up so the first row of `df` ends up with the highest rowid
+    rows = [tuple(_clean_value(r.get(c)) for c in columns) for r in reversed(df.to_dict("records"))]
+    conn.execute(f"DELETE FROM {table}")
+    conn.executemany(
+        f"INSERT OR REPLACE INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})", rows
+    )
+    _sqlite_bump_version(conn, _SQLITE_TABLE_VERSIONS[table])
+
+def _sqlite_read(sql, params=()):
+    conn = _connect()
+    try:
+        df = pd.read_sql_query(sql, conn, params=params)
+    finally:
+        conn.close()
+    if "date_received" in df.columns:
+        df["date_received"] = pd.to_datetime(df["date_received"])
+    return df
+
+def _sqlite_load_users():
+    return _sqlite_read(f"SELECT {', '.join(USER_COLUMNS)} FROM users ORDER BY rowid DESC")
+
+def _sqlite_load_tickets():
+    return typed_tickets(_sqlite_read(f"SELECT {', '.join(TICKET_COLUMNS)} FROM tickets ORDER BY rowid DESC"))
+
+def _sqlite_load_archive():
+    return typed_tickets(_sqlite_read(
+        f"SELECT {', '.join(TICKET_COLUMNS)} FROM tickets_archive ORDER BY date_received DESC, rowid DESC"
+    ))
+
+def _sqlite_tier(conn):
+    # Move finished cards to the archive table and revived ones back, inside the caller's transaction
+    terminal = ", ".join("?" * len(TERMINAL_STATUSES))
+    columns = ", ".join(TICKET_COLUMNS)
+    conn.execute(
+        f"INSERT OR REPLACE INTO tickets_archive ({columns}) SELECT {columns} FROM tickets WHERE status IN ({terminal})",
+        TERMINAL_STATUSES,
+    )
+    conn.execute(f"DELETE FROM tickets WHERE status IN ({terminal})", TERMINAL_STATUSES)
+    conn.execute(
+        f"INSERT OR REPLACE INTO tickets ({columns}) SELECT {columns} FROM tickets_archive WHERE status NOT IN ({terminal})",
+        TERMINAL_STATUSES,
+    )
+    conn.execute(f"DELETE FROM tickets_archive WHERE status NOT IN ({terminal})", TERMINAL_STATUSES)
+
+def _sqlite_query_tickets(receiver, card_type, status, start, end, columns):
+    where, params = [], []
+    for col, value in (("receiver", receiver), ("card_type", card_type), ("status", status)):
+        if value is not None:
+            where.append(f"{col} = ?")
+            params.append(value)
+    if start is not None:
+        where.append("date_received >= ?")
+        params.append(pd.Timestamp(start).strftime("%Y-%m-%d"))
+    if end is not None:
+        where.append("date_received <= ?")
+        params.append(pd.Timestamp(end).strftime("%Y-%m-%d"))
+    cols = [c for c in (columns or TICKET_COLUMNS) if c in TICKET_COLUMNS]
+    where = " WHERE " + " AND ".join(where) if where else ""
+    # NULL dates sort lowest, so they come last as in _newest_first
+    sql = (
+        f"SELECT {', '.join(cols)} FROM (SELECT * FROM tickets{where} "
+        f"UNION ALL SELECT * FROM tickets_archive{where}) ORDER BY date_received DESC, id"
+    )
+    return typed_tickets(_sqlite_read(sql, params * 2))
+
+def _sqlite_save_tickets(df):
+    conn = _connect()
+    try:
+        with conn:
+            _sqlite_replace(conn, "tickets", df, TICKET_COLUMNS)
+            conn.execute("DELETE FROM tickets_archive")
+            _sqlite_tier(conn)
+    finally:
+        conn.close()
+
+def _sqlite_apply_ticket_events(events, audit_by=None):
+    insert = (
+        f"INSERT INTO tickets ({', '.join(TICKET_COLUMNS)}) VALUES ({', '.join('?' * len(TICKET_COLUMNS))}) "
+        f"ON CONFLICT(id) DO UPDATE SET {', '.join(f'{c} = excluded.{c}' for c in TICKET_COLUMNS[1:])}"
+    )
+    conn = _connect()
+    try:
+        with conn:
+            for e in events:
+                kind = e.get("event")
+                # Changes may target a live or an archived card; _sqlite_tier sorts them out after
+                if kind == "card_issued":
+                    conn.execute("DELETE FROM tickets_archive WHERE id = ?", (e["id"],))
+                    conn.execute(insert, tuple(e["data"].get(c) for c in TICKET_COLUMNS))
+                elif kind == "status_changed":
+                    for table in ("tickets", "tickets_archive"):
+                        conn.execute(f"UPDATE {table} SET status = ? WHERE id = ?", (e["status"], e["id"]))
+                elif kind == "card_updated":
+                    changes = {k: v for k, v in e["changes"].items() if k in TICKET_COLUMNS and k != "id"}
+                    if changes:
+                        assignments = ", ".join(f"{k} = ?" for k in changes)
+                        for table in ("tickets", "tickets_archive"):
+                            conn.execute(f"UPDATE {table} SET {assignments} WHERE id = ?", (*changes.values(), e["id"]))
+                elif kind == "card_deleted":
+                    for table in ("tickets", "tickets_archive"):
+                        conn.execute(f"DELETE FROM {table} WHERE id = ?", (e["id"],))
+            if audit_by is not None:
+                # Same transaction: the audit record lands exactly when the change does
+                conn.executemany("INSERT INTO ticket_audit (event) VALUES (?)", [(json.dumps({**e, "by": audit_by}),) for e in events])
+            _sqlite_tier(conn)
+            _sqlite_bump_version(conn, "tickets")
+    finally:
+        conn.close()
+
+def _sqlite_load_rules():
+    return _sqlite_read(f"SELECT {', '.join(RULE_COLUMNS)} FROM rules ORDER BY rowid DESC")
+
+def _sqlite_save_rules(df):
+    conn = _connect()
+    try:
+        with conn:
+            _sqlite_replace(conn, "rules", df, RULE_COLUMNS)
+    finally:
+        conn.close()
+
+def _sqlite_add_rule(rule):
+    conn = _connect()
+    try:
+        with conn:
+            conn.execute(
+                f"INSERT INTO rules ({', '.join(RULE_COLUMNS)}) VALUES ({', '.join('?' * len(RULE_COLUMNS))})",
+                tuple(_clean_value(rule.get(c)) for c in RULE_COLUMNS),
+            )
+            _sqlite_bump_version(conn, "rules")
+    finally:
+        conn.close()
+
+def _sqlite_update_rules(rule_ids, fields):
+    assignments = ", ".join(f"{c} = ?" for c in fields if c in RULE_COLUMNS)
+    values = tuple(_clean_value(v) for c, v in fields.items() if c in RULE_COLUMNS)
+    conn = _connect()
+    try:
+        with conn:
+            conn.executemany(f"UPDATE rules SET {assignments} WHERE id = ?", [(*values, r) for r in rule_ids])
+            _sqlite_bump_version(conn, "rules")
+    finally:
+        conn.close()
+
+def _sqlite_delete_rules(rule_ids):
+    conn = _connect()
+    try:
+        with conn:
+            conn.executemany("DELETE FROM rules WHERE id = ?", [(r,) for r in rule_ids])
+            _sqlite_bump_version(conn, "rules")
+    finally:
+        conn.close()
+
+def _sqlite_load_approvals():
+    return _sqlite_read(f"SELECT {', '.join(APPROVAL_COLUMNS)} FROM rule_approvals ORDER BY rowid")
+
+def _sqlite_add_approval(rule_id, approver, timestamp):
+    conn = _connect()
+    try:
+        with conn:
+            conn.execute(
+                "INSERT OR IGNORE INTO rule_approvals (rule_id, approver, timestamp) VALUES (?, ?, ?)",
+                (rule_id, approver, timestamp),
+            )
+            _sqlite_bump_version(conn, "approvals")
+    finally:
+        conn.close()
+
+def _sqlite_clear_approvals(rule_ids):
+    conn = _connect()
+    try:
+        with conn:
+            conn.executemany("DELETE FROM rule_approvals WHERE rule_id = ?", [(r,) for r in rule_ids])
+            _sqlite_bump_version(conn, "approvals")
+    finally:
+        conn.close()
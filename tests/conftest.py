@@ -0,0 +1,31 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import storage  # noqa: E402
+
+BACKENDS = ["pickle", "parquet", "arrow", "sqlite"]
+
+
+def point_storage_at(root, backend):
+    """Send this process's storage calls to an empty store in `root` using `backend`"""
+    storage.flush_writes()
+    storage.ROOT = str(root)
+    storage.HOUSEHOLDS_DIR = os.path.join(str(root), "households")
+    storage.STORAGE_BACKEND = backend
+    storage._shards.clear()
+
+
+@pytest.fixture(params=BACKENDS)
+def store(request, tmp_path, monkeypatch):
+    """The storage module over an empty directory, once per backend"""
+    monkeypatch.delenv("SLACKER_DB", raising=False)
+    saved = (storage.ROOT, storage.HOUSEHOLDS_DIR, storage.STORAGE_BACKEND)
+    point_storage_at(tmp_path, request.param)
+    yield storage
+    storage.flush_writes()
+    storage.ROOT, storage.HOUSEHOLDS_DIR, storage.STORAGE_BACKEND = saved
+    storage._shards.clear()
@@ -0,0 +1,77 @@
+import datetime
+import uuid
+
+import numpy as np
+import pandas as pd
+
+from cards import YELLOW_EXPIRE_DAYS, expire_and_convert
+
+
+def loop_expire_and_convert(tickets, today):
+    """The row-by-row pass expire_and_convert replaced, minus its notifications. The only other
+    change is a stable sort, so yellows received on the same day convert in table order"""
+    changed = False
+    df = tickets.copy()
+    df["date_received"] = pd.to_datetime(df["date_received"]).dt.normalize()
+
+    mask_yellow_active = (df["card_type"] == "Yellow") & (df["status"] == "active")
+    expire_mask = mask_yellow_active & (df["date_received"] < (today - pd.Timedelta(days=YELLOW_EXPIRE_DAYS)))
+    if expire_mask.any():
+        df.loc[expire_mask, "status"] = "expired"
+        changed = True
+
+    for user in df["receiver"].unique():
+        user_mask = (df["receiver"] == user) & (df["card_type"] == "Yellow") & (df["status"] == "active")
+        active_yellows = df[user_mask].sort_values("date_received", kind="stable")
+        while len(active_yellows) >= 3:
+            to_convert = active_yellows.iloc[:3]
+            df.loc[df["id"].isin(to_convert["id"]), "status"] = "converted"
+            new_red = {
+                "id": str(uuid.uuid4()),
+                "receiver": user,
+                "card_type": "Red",
+                "date_received": today,
+                "submitted_by": "system",
+                "status": "active",
+                "note": "Auto-converted from 3 yellows",
+            }
+            df = pd.concat([pd.DataFrame([new_red]), df], ignore_index=True)
+            changed = True
+            user_mask = (df["receiver"] == user) & (df["card_type"] == "Yellow") & (df["status"] == "active")
+            active_yellows = df[user_mask].sort_values("date_received", kind="stable")
+    return df, changed
+
+
+def random_tickets(rng, n):
+    today = pd.Timestamp(datetime.date.today())
+    dates = today - pd.to_timedelta(rng.integers(0, 2 * YELLOW_EXPIRE_DAYS, n), unit="D")
+    dates = dates + pd.to_timedelta(rng.integers(0, 24, n), unit="h")  # times of day are ignored
+    dates = dates.where(rng.random(n) > 0.05)  # a few undated cards
+    return pd.DataFrame({
+        "id": [f"t{i}" for i in range(n)],
+        "receiver": rng.choice(["Cai", "Nath", "Jett", "Ana"], n),
+        "card_type": rng.choice(["Yellow", "Yellow", "Red"], n),
+        "date_received": dates,
+        "submitted_by": "test",
+        "status": rng.choice(["active", "active", "active", "expired", "converted"], n),
+        "note": "",
+    })
+
+
+def test_expire_and_convert_matches_the_row_by_row_loop():
+    rng = np.random.default_rng(4)
+    today = pd.Timestamp(datetime.date.today())
+    for n in [0, 1, 2, 3, 5, 12, 40, 150]:
+        for _ in range(10):
+            tickets = random_tickets(rng, n)
+            got, changed, receivers = expire_and_convert(tickets, today)
+            expected, expected_changed = loop_expire_and_convert(tickets, today)
+
+            assert changed == expected_changed
+            assert len(got) == len(expected)
+            new = got["submitted_by"].eq("system").to_numpy()
+            assert list(got.loc[new, "receiver"][::-1]) == receivers
+            # The new reds get fresh ids; every other column must match row for row
+            assert list(got.loc[~new, "id"]) == list(expected.loc[~new, "id"])
+            for col in ["receiver", "card_type", "date_received", "submitted_by", "status", "note"]:
+                pd.testing.assert_series_equal(got[col].astype(object), expected[col].astype(object), check_names=False)
@@ -0,0 +1,135 @@
+import multiprocessing
+import os
+import random
+import threading
+import time
+import traceback
+import uuid
+
+import pandas as pd
+
+import storage
+from conftest import point_storage_at
+
+PROCESSES = int(os.environ.get("STRESS_PROCESSES", "6"))
+ROUNDS = int(os.environ.get("STRESS_ROUNDS", "15"))
+
+
+def _hammer(root, backend, k, results):
+    # Every step is a separate locked write, racing the other processes and their flushes
+    try:
+        point_storage_at(root, backend)
+        storage.LOG_COMPACT_EVENTS = 7
+        storage.FLUSH_DELAY_SECONDS = 0.05
+        rng = random.Random(k)
+        statuses = {}
+        for i in range(ROUNDS):
+            card_id = f"p{k}-{i}"
+            storage.append_ticket_events([storage.card_issued_event({
+                "id": card_id, "receiver": rng.choice(["Cai", "Nath", "Jett"]), "card_type": "Yellow",
+                "date_received": f"2026-0{rng.randint(1, 9)}-1{rng.randint(0, 9)}", "submitted_by": "test",
+                "status": "active", "note": "",
+            })])
+            statuses[card_id] = "active"
+            if i % 3 == 0:
+                target, status = rng.choice(sorted(statuses)), rng.choice(["expired", "active", "converted"])
+                storage.append_ticket_events([storage.status_changed_event(target, status)])
+                statuses[target] = status
+            rule_id = f"r{k}-{i}"
+            storage.add_rule({"id": rule_id, "text": "rule", "created_by": "test", "status": "pending_add",
+                              "approvals": "", "proposed_by": "test", "timestamp": ""})
+            storage.add_approval(rule_id, f"voter{k}")
+            storage.load_tickets()
+            storage.load_all_tickets()
+        storage.flush_writes()
+        results.put(statuses)
+    except Exception:
+        results.put(traceback.format_exc())
+
+
+def _convert_three(tickets):
+    # A stand-in for the app's conversion pass, slow enough for two passes to overlap
+    yellows = tickets[(tickets["card_type"] == "Yellow") & (tickets["status"] == "active")]
+    if len(yellows) < 3:
+        return tickets, False
+    df = tickets.copy()
+    df.loc[yellows.index[:3], "status"] = "converted"
+    red = pd.DataFrame([{"id": str(uuid.uuid4()), "receiver": "Cai", "card_type": "Red", "date_received": pd.Timestamp.today().normalize(),
+                         "submitted_by": "system", "status": "active", "note": "Auto-converted from 3 yellows"}])
+    time.sleep(0.2)
+    return storage.typed_tickets(pd.concat([red, df], ignore_index=True)), True
+
+
+def _expiry_pass(root, backend, start, results):
+    try:
+        point_storage_at(root, backend)
+        storage.load_tickets()
+        start.wait()
+        storage.run_expiry_pass(_convert_three)
+        storage.flush_writes()
+        results.put(None)
+    except Exception:
+        results.put(traceback.format_exc())
+
+
+def _run(target, args_for):
+    ctx = multiprocessing.get_context("spawn")
+    results = ctx.Queue()
+    procs = [ctx.Process(target=target, args=(*args_for(ctx, k), results)) for k in range(PROCESSES)]
+    for p in procs:
+        p.start()
+    out = [results.get(timeout=300) for _ in procs]
+    for p in procs:
+        p.join()
+    errors = [r for r in out if isinstance(r, str)]
+    assert not errors, errors[0]
+    return out
+
+
+def test_concurrent_writers_lose_nothing(store, tmp_path):
+    results = _run(_hammer, lambda ctx, k: (str(tmp_path), store.STORAGE_BACKEND, k))
+    expected = {card: status for statuses in results for card, status in statuses.items()}
+
+    store.clear_cache()
+    history = store.load_all_tickets()
+    got = dict(zip(history["id"].astype(str), history["status"].astype(str)))
+    assert len(history) == len(got), "a card is stored twice"
+    assert {card: got.get(card) for card in expected} == expected
+    assert store.load_rules()["id"].nunique() == PROCESSES * ROUNDS
+    assert len(store.load_approvals()) == PROCESSES * ROUNDS
+
+
+def test_concurrent_expiry_passes_convert_once(store, tmp_path):
+    store.append_ticket_events([store.card_issued_event({
+        "id": f"y{i}", "receiver": "Cai", "card_type": "Yellow", "date_received": pd.Timestamp.today().normalize(),
+        "submitted_by": "test", "status": "active", "note": "",
+    }) for i in range(3)])
+    store.flush_writes()
+    start = multiprocessing.get_context("spawn").Barrier(PROCESSES)
+    _run(_expiry_pass, lambda ctx, k: (str(tmp_path), store.STORAGE_BACKEND, start))
+
+    store.clear_cache()
+    history = store.load_all_tickets()
+    assert (history["card_type"] == "Red").sum() == 1
+    assert (history["status"] == "converted").sum() == 3
+
+
+def test_cache_hits_do_not_wait_for_writers(store):
+    store.load_users()
+    store.load_tickets()
+    holding = threading.Event()
+
+    def write():
+        with store._store_lock():
+            holding.set()
+            time.sleep(1)
+
+    writer = threading.Thread(target=write)
+    writer.start()
+    holding.wait()
+    started = time.monotonic()
+    store.load_users()
+    store.load_tickets()
+    assert time.monotonic() - started < 0.5
+    writer.join()
+
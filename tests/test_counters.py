@@ -0,0 +1,102 @@
+import datetime
+import gc
+
+import numpy as np
+import pandas as pd
+
+import cards
+
+USERS = ["Cai", "Nath", "Jett"]
+
+
+def card(card_id, receiver, card_type="Yellow", status="active", days_ago=1):
+    received = pd.Timestamp(datetime.date.today() - datetime.timedelta(days=days_ago))
+    return {"id": card_id, "receiver": receiver, "card_type": card_type, "date_received": received,
+            "submitted_by": "test", "status": status, "note": ""}
+
+
+def test_incremental_counters_match_a_rebuild(store, monkeypatch):
+    store.append_ticket_events([store.card_issued_event(c) for c in [
+        card("y1", "Cai", days_ago=9), card("y2", "Cai", days_ago=8), card("y3", "Cai", days_ago=7),
+        card("y4", "Cai", days_ago=20), card("y5", "Nath"), card("y6", "Nath"), card("r1", "Nath", "Red"),
+    ]])
+    builds = []
+    build = store.build_card_counters
+    monkeypatch.setattr(store, "build_card_counters", lambda tickets: builds.append(1) or build(tickets))
+    store.user_counters(USERS)
+
+    # add
+    store.append_ticket_events([store.card_issued_event(card("y7", "Nath", days_ago=2))])
+    # convert three yellows into a red
+    store.append_ticket_events([store.status_changed_event(c, "converted", before="active") for c in ["y1", "y2", "y3"]]
+                               + [store.card_issued_event(card("c1", "Cai", "Red"))])
+    # expire, then flush so the finished cards move to the archive
+    store.append_ticket_events([store.status_changed_event("y4", "expired", before="active")])
+    store.flush_writes()
+    # edit a live card and an archived one
+    store.append_ticket_events([
+        store.card_updated_event("y5", {"receiver": "Jett"}, before={"receiver": "Nath"}),
+        store.card_updated_event("y4", {"receiver": "Nath"}, before={"receiver": "Cai"}),
+    ])
+    # delete
+    store.append_ticket_events([store.card_deleted_event("y6")])
+
+    assert len(builds) == 1, "events should be applied as deltas, not by rebuilding"
+    summary = store.user_counters(USERS).set_index("username")
+    assert store.verify_user_counters()
+
+    fields = ["total_yellows", "total_reds", "yellow_active", "red_active"]
+    assert summary.loc["Cai", fields].tolist() == [3, 1, 0, 1]
+    assert summary.loc["Nath", fields].tolist() == [2, 1, 1, 1]
+    assert summary.loc["Jett", fields].tolist() == [1, 0, 1, 0]
+    assert summary.loc["Nath", "next_expiry"] == pd.Timestamp(datetime.date.today() - datetime.timedelta(days=2)) + pd.Timedelta(days=30)
+
+
+def test_card_buckets_are_memoized_per_frame():
+    houses = [pd.DataFrame([card("y1", "Cai")]), pd.DataFrame([card("y1", "Nath"), card("r1", "Nath", "Red")])]
+    first = [cards.daily_card_buckets(tickets) for tickets in houses]
+    # Alternating between households reuses each one's buckets instead of rebuilding
+    assert all(cards.daily_card_buckets(tickets) is buckets for tickets, buckets in zip(houses, first))
+    assert list(first[1]["users"]) == ["Nath"]
+
+    key = id(houses.pop())
+    gc.collect()
+    assert key not in cards._buckets
+
+
+def test_window_leaderboard_matches_a_brute_force_count():
+    rng = np.random.default_rng(22)
+    today = pd.Timestamp(datetime.date.today())
+    n = 300
+    dates = today - pd.to_timedelta(rng.integers(0, 120, n), unit="D") + pd.to_timedelta(rng.integers(0, 24, n), unit="h")
+    tickets = pd.DataFrame({
+        "id": [f"t{i}" for i in range(n)],
+        "receiver": rng.choice(USERS, n),
+        "card_type": rng.choice(["Yellow", "Red"], n),
+        "date_received": dates.where(rng.random(n) > 0.05),
+        "status": rng.choice(["active", "expired", "converted"], n),
+    })
+    buckets = cards.daily_card_buckets(tickets)
+    first, last = tickets["date_received"].min().normalize(), tickets["date_received"].max().normalize()
+    day = pd.Timedelta(days=1)
+
+    windows = [
+        (first, last), (first, first), (last, last), (last, first),  # whole range, single days, empty
+        (first - 30 * day, first - day), (last + day, last + 30 * day),  # entirely outside
+        (first - 30 * day, last + 30 * day), (first - 5 * day, first + 5 * day), (last - 5 * day, last + 5 * day),
+        (first + 10 * day + pd.Timedelta(hours=20), last - 10 * day + pd.Timedelta(hours=1)),  # times are ignored
+    ]
+    for offset in rng.integers(-10, 130, (20, 2)):
+        windows.append((first + int(min(offset)) * day, first + int(max(offset)) * day))
+
+    usernames = USERS + ["Nobody"]
+    for start, end in windows:
+        board = cards.window_leaderboard(buckets, usernames, start, end).set_index("username")
+        received = tickets["date_received"].dt.normalize()
+        inside = tickets[(received >= start.normalize()) & (received <= end.normalize())]
+        for user in usernames:
+            mine = inside[inside["receiver"] == user]
+            yellows, reds = int((mine["card_type"] == "Yellow").sum()), int((mine["card_type"] == "Red").sum())
+            assert (board.at[user, "yellows"], board.at[user, "reds"]) == (yellows, reds), (start, end, user)
+            assert board.at[user, "slacker_score"] == yellows + reds * cards.RED_WEIGHT
+        assert board["slacker_score"].is_monotonic_decreasing
@@ -0,0 +1,133 @@
+import threading
+import time
+
+import pytest
+import requests
+from requests.adapters import HTTPAdapter
+
+import notify
+
+
+class StubAdapter(HTTPAdapter):
+    """Answers every request itself with the next scripted status code or exception (200 once the script runs out)"""
+
+    def __init__(self, *outcomes):
+        super().__init__()
+        self.outcomes = list(outcomes)
+        self.requests = []
+        self.sent_at = []
+        self.hold = threading.Event()  # set to make the next request wait until `release` is set
+        self.release = threading.Event()
+
+    def send(self, request, **kwargs):
+        self.requests.append(request)
+        self.sent_at.append(time.monotonic())
+        if self.hold.is_set():
+            self.hold.clear()
+            self.release.wait(5)
+        outcome = self.outcomes.pop(0) if self.outcomes else 200
+        if isinstance(outcome, Exception):
+            raise outcome
+        resp = requests.Response()
+        resp.status_code = outcome
+        resp._content = b""
+        resp.request = request
+        resp.url = request.url
+        return resp
+
+
+@pytest.fixture
+def stub(monkeypatch):
+    """A stub transport in place of the real server, with fresh counters and a short backoff"""
+    assert notify.flush(5)
+    # Even a request that got past the stub could never reach the public ntfy.sh topic
+    monkeypatch.setattr(notify, "NTFY_SERVER", "http://ntfy.invalid")
+    monkeypatch.setattr(notify, "BACKOFF_SECONDS", 0.02)
+    monkeypatch.setattr(notify, "DIGEST_SECONDS", 0)
+    for key in notify._stats:
+        monkeypatch.setitem(notify._stats, key, None if key == "last_latency" else 0)
+    adapter = StubAdapter()
+    notify.set_transport(adapter)
+    yield adapter
+    adapter.release.set()
+    assert notify.flush(5)
+    notify.set_transport(None)
+
+
+def bodies(adapter):
+    return [r.body.decode("utf-8") for r in adapter.requests]
+
+
+def test_set_transport_routes_every_request_through_the_adapter(stub):
+    notify.send_ntfy("Cai got a yellow ✋", title="Yellow card", topic="house", priority="default")
+    assert notify.flush(5)
+    [request] = stub.requests
+    assert request.url == "http://ntfy.invalid/house"
+    assert (request.headers["Title"], request.headers["Priority"]) == ("Yellow card", "default")
+    assert bodies(stub) == ["Cai got a yellow ✋"]
+    assert notify.notification_stats()["sent"] == 1
+
+    # None puts the pooled default transport back
+    notify.set_transport(None)
+    assert type(notify._get_session().get_adapter("http://ntfy.invalid/house")) is HTTPAdapter
+
+
+def test_failed_attempts_are_retried_with_doubling_backoff(stub):
+    stub.outcomes = [503, 429, requests.ConnectionError("down")]
+    notify.send_ntfy("retry me")
+    assert notify.flush(5)
+    assert bodies(stub) == ["retry me"] * 4
+    gaps = [b - a for a, b in zip(stub.sent_at, stub.sent_at[1:])]
+    assert all(gap >= notify.BACKOFF_SECONDS * 2 ** i for i, gap in enumerate(gaps))
+    stats = notify.notification_stats()
+    assert (stats["sent"], stats["retries"], stats["failed"]) == (1, 3, 0)
+
+
+def test_delivery_gives_up_after_max_attempts_and_on_client_errors(stub):
+    stub.outcomes = [500] * notify.MAX_ATTEMPTS + [400]
+    notify.send_ntfy("server down")
+    notify.send_ntfy("bad request")
+    assert notify.flush(5)
+    assert bodies(stub) == ["server down"] * notify.MAX_ATTEMPTS + ["bad request"]
+    stats = notify.notification_stats()
+    assert (stats["sent"], stats["retries"], stats["failed"]) == (0, notify.MAX_ATTEMPTS - 1, 2)
+
+
+@pytest.mark.parametrize("policy, kept", [("drop_oldest", ["m3", "m4", "m5"]), ("drop_newest", ["m1", "m2", "m3"])])
+def test_a_full_queue_drops_by_policy(stub, monkeypatch, policy, kept):
+    monkeypatch.setattr(notify, "QUEUE_SIZE", 3)
+    monkeypatch.setattr(notify, "OVERFLOW_POLICY", policy)
+    # Hold the first delivery so the rest pile up behind it
+    stub.hold.set()
+    notify.send_ntfy("m0")
+    while stub.hold.is_set():
+        time.sleep(0.01)
+    for i in range(1, 6):
+        notify.send_ntfy(f"m{i}")
+    assert notify.notification_stats()["dropped"] == 2
+    stub.release.set()
+    assert notify.flush(5)
+    assert bodies(stub) == ["m0"] + kept
+
+
+def test_digest_sends_one_combined_message_per_topic(stub, monkeypatch):
+    monkeypatch.setattr(notify, "DIGEST_SECONDS", 60)
+    notify.send_ntfy("Cai got a yellow", title="Yellow card", priority="default")
+    notify.send_ntfy("Nath got a yellow", title="Yellow card", priority="urgent")
+    notify.send_ntfy("rule passed", title="Rules", topic="other", priority="low")
+    assert notify.notification_stats()["in_digest"] == 3
+    assert stub.requests == []
+    assert notify.flush(5)
+    by_topic = {r.url.rsplit("/", 1)[1]: r for r in stub.requests}
+    combined = by_topic[notify.NTFY_TOPIC]
+    assert (combined.headers["Title"], combined.headers["Priority"]) == ("Yellow card (2)", "urgent")
+    assert combined.body.decode("utf-8") == "• Cai got a yellow\n• Nath got a yellow"
+    assert by_topic["other"].body.decode("utf-8") == "rule passed"
+
+
+def test_combine_keeps_each_title_when_they_differ():
+    items = [(1.0, "Cai got a yellow", "Yellow card", "t", "low"), (2.0, "rule passed", "Rules", "t", "high"),
+             (3.0, "no title", None, "t", "odd")]
+    assert notify._combine(items) == (1.0, "• Yellow card: Cai got a yellow\n• Rules: rule passed\n• no title",
+                                      "3 updates", "t", "high")
+    assert notify._combine(items[:1]) == items[0]
@@ -0,0 +1,32 @@
+import gc
+
+import pandas as pd
+
+import rules
+
+
+def household(*usernames):
+    users = pd.DataFrame({"username": ["admin", *usernames]})
+    pending = pd.DataFrame({"id": ["r1"], "text": ["rule"], "status": ["pending_add"], "proposed_by": [usernames[0]]})
+    approvals = pd.DataFrame({"rule_id": ["r1"], "approver": [usernames[1]]})
+    return pending, approvals, users
+
+
+def test_approval_index_is_memoized_per_household():
+    houses = [household("Cai", "Nath", "Jett"), household("Ana", "Bo")]
+    first = [rules.approval_index(*frames) for frames in houses]
+    # Alternating between households reuses each one's index instead of rebuilding
+    assert all(rules.approval_index(*frames) is index for frames, index in zip(houses, first))
+    assert first[0]["outstanding"] == {"r1": 1} and first[0]["awaiting"] == {"Jett": {"r1"}}
+    assert first[1]["outstanding"] == {"r1": 0}
+    assert rules.required_approvers(houses[0][2], "Cai") == ("Jett", "Nath")
+    assert rules.required_approvers(houses[1][2], "Ana") == ("Bo",)
+
+    # A new approvals frame for the same rules rebuilds the index
+    pending, approvals, users = houses[0]
+    votes = pd.concat([approvals, pd.DataFrame({"rule_id": ["r1"], "approver": ["Jett"]})])
+    assert rules.approval_index(pending, votes, users)["outstanding"] == {"r1": 0}
+
+    keys = [id(frame) for frame in houses.pop()]
+    gc.collect()
+    assert keys[0] not in rules._index and keys[2] not in rules._directory
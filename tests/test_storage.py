@@ -0,0 +1,212 @@
+import datetime
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import storage
+
+
+def test_arrow_appends_are_folded_back_into_the_mapping(store):
+    if store.STORAGE_BACKEND != "arrow":
+        pytest.skip("arrow mode only")
+    store.append_ticket_events([store.card_issued_event({
+        "id": "a1", "receiver": "Cai", "card_type": "Yellow", "date_received": pd.Timestamp.today().normalize(),
+        "submitted_by": "test", "status": "active", "note": "",
+    })])
+    assert store.flush_writes()
+    assert not os.path.exists(store._path(store.TICKETS_LOG))
+    assert list(store.load_tickets()["id"]) == ["a1"]
+
+
+def test_rule_writes_leave_ticket_caches_alone(store, monkeypatch):
+    store.append_ticket_events([store.card_issued_event({
+        "id": "y1", "receiver": "Cai", "card_type": "Yellow", "date_received": pd.Timestamp.today().normalize(),
+        "submitted_by": "test", "status": "active", "note": "",
+    })])
+    store.user_counters(["Cai"])
+    today = pd.Timestamp.today().normalize()
+    stamp = store.pending_expiry_pass(today)
+    store.finish_expiry_pass(stamp, None)
+    tickets = store.load_all_tickets()
+
+    builds = []
+    build = store.build_card_counters
+    monkeypatch.setattr(store, "build_card_counters", lambda t: builds.append(1) or build(t))
+    store.add_rule({"id": "r1", "text": "rule", "created_by": "Cai", "status": "pending_add",
+                    "approvals": "", "proposed_by": "Cai", "timestamp": ""})
+    store.add_approval("r1", "Nath")
+
+    assert store.load_all_tickets() is tickets
+    store.user_counters(["Cai"])
+    assert not builds
+    assert store.pending_expiry_pass(today) is None
+
+
+def test_log_appends_are_synced(store, monkeypatch):
+    if store.STORAGE_BACKEND == "sqlite":
+        pytest.skip("SQLite commits its own writes")
+    synced = []
+    fsync = os.fsync
+    monkeypatch.setattr(os, "fsync", lambda fd: synced.append(os.readlink(f"/proc/self/fd/{fd}")) or fsync(fd))
+    store.append_ticket_events([store.card_issued_event({
+        "id": "y1", "receiver": "Cai", "card_type": "Yellow", "date_received": pd.Timestamp.today().normalize(),
+        "submitted_by": "test", "status": "active", "note": "",
+    })])
+    names = [os.path.basename(path) for path in synced]
+    assert store.TICKETS_LOG in names
+    assert not any(name.startswith(store.VERSIONS_FILE) for name in names)
+
+
+def test_query_tickets_is_the_same_newest_first_on_every_backend(store):
+    rng = np.random.default_rng(2)
+    today = pd.Timestamp.today().normalize()
+    n = 60
+    tickets = pd.DataFrame({
+        "id": [f"t{i:02d}" for i in rng.permutation(n)],
+        "receiver": rng.choice(["Cai", "Nath", "Jo"], n),
+        "card_type": rng.choice(["Yellow", "Red"], n),
+        # Few distinct dates, so plenty of ties for the id order to break
+        "date_received": today - pd.to_timedelta(rng.integers(0, 90, n) // 15 * 15, unit="D"),
+        "submitted_by": "test",
+        "status": rng.choice(["active", "expired", "converted"], n),
+        "note": "",
+    })
+    store.save_tickets(tickets)
+    store.flush_writes()
+
+    queries = [
+        {},
+        {"receiver": "Cai"},
+        {"status": "active", "card_type": "Yellow"},
+        {"start": today - pd.Timedelta(days=45), "end": today - pd.Timedelta(days=15)},
+        {"receiver": "Nath", "columns": ["receiver", "status"]},
+    ]
+    for query in queries:
+        expected = tickets
+        for col in ("receiver", "card_type", "status"):
+            if col in query:
+                expected = expected[expected[col] == query[col]]
+        if "start" in query:
+            expected = expected[expected["date_received"].between(query["start"], query["end"])]
+        expected = expected.sort_values(["date_received", "id"], ascending=[False, True])
+        got = store.query_tickets(**query)
+        assert list(got.columns) == query.get("columns", store.TICKET_COLUMNS)
+        for col in got.columns:
+            assert list(got[col].astype(object)) == list(expected[col].astype(object)), (query, col)
+
+
+def test_arrow_snapshots_never_replace_a_mapped_file(store, monkeypatch):
+    if store.STORAGE_BACKEND != "arrow":
+        pytest.skip("arrow mode only")
+    today = pd.Timestamp.today().normalize()
+
+    def issue(card_id):
+        store.append_ticket_events([store.card_issued_event({
+            "id": card_id, "receiver": "Cai", "card_type": "Yellow", "date_received": today,
+            "submitted_by": "test", "status": "active", "note": "",
+        })])
+        assert store.flush_writes()
+
+    issue("a1")
+    mapped = store.load_tickets()
+    # Windows refuses to replace or delete a file while it is mapped
+    held = set(store._arrow_snapshots())
+    replace, remove = os.replace, os.remove
+
+    def refuse(op):
+        def call(src, *args):
+            if os.path.abspath(args[0] if args else src) in held:
+                raise PermissionError(f"{args[0] if args else src} is mapped")
+            return op(src, *args)
+        return call
+    monkeypatch.setattr(os, "replace", refuse(replace))
+    monkeypatch.setattr(os, "remove", refuse(remove))
+
+    issue("a2")
+    assert list(store.load_tickets()["id"]) == ["a2", "a1"]
+    assert list(mapped["id"]) == ["a1"]
+    assert len(store._arrow_snapshots()) == 2
+
+    # Once nothing maps the old snapshot, the next write removes it
+    held.clear()
+    issue("a3")
+    assert len(store._arrow_snapshots()) == 1
+
+
+def test_audit_limit_reads_only_the_newest_events(store, monkeypatch):
+    store.append_ticket_events([store.card_issued_event({
+        "id": "y1", "receiver": "Cai", "card_type": "Yellow", "date_received": pd.Timestamp.today().normalize(),
+        "submitted_by": "test", "status": "active", "note": "",
+    })])
+    for i in range(40):
+        store.append_ticket_events([store.card_updated_event("y1", {"note": f"edit {i} é"}, before={"note": ""})],
+                                   audit_by="admin")
+    # Tiny blocks, so the tail is gathered over many reads that split lines and characters
+    tail = store._tail_lines
+    monkeypatch.setattr(store, "_tail_lines", lambda path, count: tail(path, count, block=7))
+
+    everything = store.read_ticket_audit()
+    assert [e["changes"]["note"] for e in everything] == [f"edit {i} é" for i in range(40)]
+    assert store.read_ticket_audit(5) == everything[-5:]
+    assert store.read_ticket_audit(100) == everything
+    assert store.read_ticket_audit(0) == []
+
+
+def test_ticket_events_ignore_dtype_differences():
+    today = pd.Timestamp.today().normalize()
+    old = storage.typed_tickets(pd.DataFrame({
+        "id": ["y1", "y2", "r1"],
+        "receiver": ["Cai", "Nath", "Cai"],
+        "card_type": ["Yellow", "Yellow", "Red"],
+        "date_received": [today, today - pd.Timedelta(days=3), pd.NaT],
+        "submitted_by": ["test", "test", "test"],
+        "status": ["active", "active", "active"],
+        "note": [np.nan, "late", None],
+    }))
+    assert isinstance(old["status"].dtype, pd.CategoricalDtype)
+
+    # What the data editor hands back: plain object/str columns, datetime.date values and None for NaN
+    edited = old.astype(object)
+    edited["date_received"] = [today.date(), (today - pd.Timedelta(days=3)).date(), None]
+    edited["note"] = [None, "late", np.nan]
+    assert storage.ticket_events(old, edited) == []
+
+    edited.loc[0, "status"] = "expired"
+    edited.loc[1, "date_received"] = datetime.date(2024, 1, 5)
+    edited.loc[2, "note"] = "appealed"
+    events = storage.ticket_events(old, edited)
+    assert [(e["event"], e["id"]) for e in events] == [
+        ("status_changed", "y1"), ("card_updated", "y2"), ("card_updated", "r1")]
+    assert (events[0]["status"], events[0]["before"]) == ("expired", {"status": "active"})
+    assert (events[1]["changes"], events[1]["before"]) == (
+        {"date_received": "2024-01-05"}, {"date_received": (today - pd.Timedelta(days=3)).strftime("%Y-%m-%d")})
+    assert (events[2]["changes"], events[2]["before"]) == ({"note": "appealed"}, {"note": None})
+
+
+def test_admin_edits_reach_archived_cards(store):
+    today = pd.Timestamp.today().normalize()
+    store.save_tickets(pd.DataFrame({
+        "id": ["y1", "y2"], "receiver": ["Cai", "Nath"], "card_type": ["Yellow", "Yellow"],
+        "date_received": [today, today - pd.Timedelta(days=40)], "submitted_by": ["test", "test"],
+        "status": ["active", "expired"], "note": ["", ""],
+    }))
+    store.flush_writes()
+    assert list(store.load_tickets()["id"]) == ["y1"]
+
+    # The admin editor works on every card, live and archived
+    old = store.load_all_tickets()
+    edited = old.astype(object)
+    edited.loc[edited["id"] == "y2", "note"] = "appealed"
+    edited.loc[edited["id"] == "y2", "date_received"] = (today - pd.Timedelta(days=41)).date()
+    events = store.ticket_events(old, edited)
+    assert [(e["event"], e["id"]) for e in events] == [("card_updated", "y2")]
+    store.append_ticket_events(events, audit_by="admin")
+    store.flush_writes()
+
+    archived = store.load_all_tickets().set_index("id").loc["y2"]
+    assert (archived["note"], archived["date_received"]) == ("appealed", today - pd.Timedelta(days=41))
+    assert list(store.load_tickets()["id"]) == ["y1"]
+    assert store.ticket_events(store.load_all_tickets(), edited) == []
+    assert [e["by"] for e in store.read_ticket_audit()] == ["admin"]